@@ -1,24 +1,57 @@
-from supabase import create_client, Client
 from typing import Optional
+import asyncio
 import os
 
-_supabase: Optional[Client] = None
-
-def get_supabase() -> Client:
-    global _supabase
-    
-    if _supabase is None:
-        supabase_url = os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_KEY")
-        
-        if not supabase_url:
-            raise ValueError("SUPABASE_URL environment variable is required")
-        if not supabase_key:
-            raise ValueError("SUPABASE_KEY environment variable is required")
-
-        _supabase = create_client(supabase_url, supabase_key)
-    
-    return _supabase
-
-def get_database() -> Client:
-    return get_supabase()
+from app.services.storage import Database
+
+_database: Optional[Database] = None
+_database_lock = asyncio.Lock()
+
+
+async def get_supabase() -> Database:
+    from app.services.supabase_store import SupabaseDatabase
+
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_KEY")
+
+    if not supabase_url:
+        raise ValueError("SUPABASE_URL environment variable is required")
+    if not supabase_key:
+        raise ValueError("SUPABASE_KEY environment variable is required")
+
+    return await SupabaseDatabase.connect(supabase_url, supabase_key)
+
+
+async def get_sqlite() -> Database:
+    from app.services.sqlite_store import SQLiteDatabase
+
+    return await SQLiteDatabase.connect(os.getenv("SQLITE_PATH", "yesornext.db"))
+
+
+async def get_database() -> Database:
+    """
+    Return the process-wide Database, picked by DATABASE_BACKEND:
+    "supabase" (default) or "sqlite" for an embedded single-node store.
+    """
+    global _database
+
+    if _database is None:
+        async with _database_lock:
+            if _database is None:
+                backend = os.getenv("DATABASE_BACKEND", "supabase").lower()
+                if backend == "sqlite":
+                    _database = await get_sqlite()
+                elif backend == "supabase":
+                    _database = await get_supabase()
+                else:
+                    raise ValueError(f"Unknown DATABASE_BACKEND: {backend}")
+
+    return _database
+
+
+async def close_database() -> None:
+    global _database
+
+    if _database is not None:
+        await _database.close()
+        _database = None
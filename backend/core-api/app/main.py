@@ -1,12 +1,45 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import os
 
 from app.routers import restaurants, chat, talk, tts
+from app.services.http_client import get_http_client, close_http_client
+from app.deps.database import get_database, close_database
+from app.services.circuit_breaker import ServiceUnavailableError, get_circuit_breaker_stats
+from app.services.candidates import get_candidate_queue
+from app.services.persistence import get_write_behind_queue
+from app.services.conversations import get_conversation_resolver
+from app.services.preferences import get_preference_profiles
+from app.services.response_archive import get_response_archive
+from app.services.tts_cache import get_speech_cache
+from app.services.whisper_service import start_stt_service, close_stt_service, get_local_stt_stats
+from app.services.yelp_ai import (
+    get_business_details_cache,
+    get_chat_response_cache,
+    get_single_flight_stats,
+    get_rate_limit_stats
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_http_client()
+    await get_database()
+    get_write_behind_queue().start()
+    await start_stt_service()
+    yield
+    await close_stt_service()
+    await get_write_behind_queue().stop()
+    await close_database()
+    await close_http_client()
+
 
 app = FastAPI(
     title=os.getenv("API_TITLE", "Core API"),
-    version=os.getenv("API_VERSION", "1.0.0")
+    version=os.getenv("API_VERSION", "1.0.0"),
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -15,8 +48,18 @@ app.add_middleware(
     allow_credentials=os.getenv("CORS_ALLOW_CREDENTIALS", "true").lower() == "true",
     allow_methods=os.getenv("CORS_ALLOW_METHODS", "*").split(","),
     allow_headers=os.getenv("CORS_ALLOW_HEADERS", "*").split(","),
+    expose_headers=["X-Next-Cursor", "ETag", "Content-Location"],
 )
 
+# Open circuits (CircuitOpenError) and a full local STT queue (STTBusyError)
+@app.exception_handler(ServiceUnavailableError)
+async def service_unavailable_handler(request: Request, exc: ServiceUnavailableError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_after) + 1)}
+    )
+
 app.include_router(restaurants.router)
 app.include_router(chat.router)
 app.include_router(talk.router)
@@ -28,4 +71,21 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "business_details_cache": get_business_details_cache().stats(),
+        "chat_response_cache": get_chat_response_cache().stats(),
+        "single_flight": get_single_flight_stats(),
+        "yelp_rate_limit": get_rate_limit_stats(),
+        "circuit_breakers": get_circuit_breaker_stats(),
+        "candidate_queue": get_candidate_queue().stats(),
+        "write_behind": get_write_behind_queue().stats(),
+        "conversation_cache": get_conversation_resolver().stats(),
+        "preference_profiles": get_preference_profiles().stats(),
+        "response_archive": get_response_archive().stats(),
+        "tts_cache": get_speech_cache().stats(),
+        "local_stt": get_local_stt_stats(),
+    }
@@ -1,14 +1,30 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
-import requests
+from typing import Optional, List, Literal
+import httpx
+import asyncio
+import json
+import os
 import math
 import uuid
-from app.services.yelp_ai import YelpAIService
+import logging
+from app.services.yelp_ai import get_yelp_ai_service
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.candidates import get_candidate_queue, candidate_key, candidate_response
+from app.services.persistence import record_prompt
+from app.services.conversations import get_conversation_resolver
+from app.services.pagination import encode_cursor, decode_cursor
+from app.services.response_archive import get_response_archive
 from app.deps.database import get_database
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
+# "full" cards are enriched from /v3/businesses/{id}; "lite" cards use only the Yelp AI entity
+DEFAULT_CARD_MODE = os.getenv("CARD_MODE", "full")
+
 
 class ChatRequest(BaseModel):
     message: Optional[str] = None
@@ -19,6 +35,7 @@ class ChatRequest(BaseModel):
     locale: str = "en_US"
     action: Optional[str] = None  # "yes", "next", or None
     businessId: Optional[str] = None
+    cardMode: Optional[Literal["full", "lite"]] = None  # Defaults to the CARD_MODE setting
 
 
 class Restaurant(BaseModel):
@@ -34,6 +51,7 @@ class Restaurant(BaseModel):
     address: Optional[str] = None
     phone: Optional[str] = None
     url: Optional[str] = None
+    missingFields: Optional[List[str]] = None  # Fields not known without the details API (lite cards)
 
 
 class ChatResponse(BaseModel):
@@ -73,9 +91,39 @@ def pick_businesses(yelp_json: dict, limit: int = 3):
     return businesses[:limit] if businesses else []
 
 
+def find_business(yelp_json: dict, business_id: Optional[str]) -> Optional[dict]:
+    """The entity for business_id in a Yelp AI response, if it is there"""
+    for entity in yelp_json.get("entities", []):
+        for biz in entity.get("businesses", []):
+            if business_id and biz.get("id") == business_id:
+                return biz
+    return None
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Strong references to in-flight persistence tasks so they are not garbage collected
+_persist_tasks: set = set()
+
+
+def _on_persist_done(task: asyncio.Task) -> None:
+    _persist_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Failed to persist chat turn: {str(task.exception())}")
+
+
 @router.post("", response_model=ChatResponse)
-async def chat(request: ChatRequest, db=Depends(get_database)):
-    """Handle chat requests with Yelp AI"""
+async def chat(request: ChatRequest, http_request: Request, db=Depends(get_database)):
+    """
+    Handle chat requests with Yelp AI.
+
+    Clients that send `Accept: text/event-stream` get Server-Sent Events instead
+    of a single JSON body: a `message` event as soon as Yelp AI answers, one
+    `restaurant` event per card as its details resolve, then a `done` event
+    carrying the full ChatResponse, or an `error` event if the cards failed.
+    """
     if not request.message and not request.action:
         raise HTTPException(
             status_code=400,
@@ -84,17 +132,25 @@ async def chat(request: ChatRequest, db=Depends(get_database)):
     
     # Initialize Yelp AI Service
     try:
-        yelp_service = YelpAIService()
+        yelp_service = get_yelp_ai_service()
     except ValueError as e:
         raise HTTPException(
             status_code=500,
             detail=str(e)
         )
     
+    session_id = request.sessionId or str(uuid.uuid4())
+    queue_key = candidate_key(session_id, request.chatId)
+    candidate_queue = get_candidate_queue()
+    
+    # The card the user said yes to; Yelp AI has not seen it if it came from the prefetch queue
+    chosen = candidate_queue.shown_business(queue_key, request.businessId) if request.action == "yes" else None
+    
     # Build query for Yelp AI
     if request.action == "yes":
+        selected = chosen.get("name") if chosen else None
         query = (
-            "The user has selected this restaurant and wants to proceed. "
+            f"The user has selected {selected or 'this restaurant'} and wants to proceed. "
             "Respond warmly and ask what they'd like to do next: make a reservation, get directions, or something else. "
             "Keep your response brief and friendly - just one sentence asking what they'd like to do."
         )
@@ -104,69 +160,71 @@ async def chat(request: ChatRequest, db=Depends(get_database)):
         # Request 3 restaurants for swipeable options
         query = f"Recommend EXACTLY 3 restaurants that match the user's request.\nNo lists. No alternatives.\nKeep the 'why' to one sentence for each.\n\nUser: {request.message}"
     
-    # Call Yelp AI Chat API using the service
-    try:
-        yelp_json = yelp_service.chat(
-            query=query,
-            latitude=request.latitude,
-            longitude=request.longitude,
-            chat_id=request.chatId,
-            locale=request.locale
-        )
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(
-            status_code=502,
-            detail=f"Yelp AI API error: {str(e)}"
-        )
+    # "next" is served from the candidates prefetched for this session when there are any
+    candidate = None
+    if request.action == "next" and request.sessionId:
+        candidate = await candidate_queue.next_candidate(queue_key)
+    
+    if candidate is not None:
+        yelp_json = candidate_response(request.chatId, candidate)
+    else:
+        # Call Yelp AI Chat API using the service
+        try:
+            yelp_json = await yelp_service.achat(
+                query=query,
+                latitude=request.latitude,
+                longitude=request.longitude,
+                chat_id=request.chatId,
+                locale=request.locale,
+                use_cache=not request.action
+            )
+        except httpx.HTTPError as e:
+            raise HTTPException(
+                status_code=502,
+                detail=f"Yelp AI API error: {str(e)}"
+            )
+        
+        shown_ids = [biz["id"] for biz in pick_businesses(yelp_json, limit=3) if biz.get("id")]
+        if not request.action:
+            candidate_queue.schedule_prefetch(
+                yelp_service, candidate_key(session_id, yelp_json.get("chat_id") or request.chatId), yelp_json,
+                shown_ids, request.message or "", request.latitude, request.longitude, request.locale
+            )
+        elif request.action == "next":
+            candidate_queue.mark_shown(queue_key, pick_businesses(yelp_json, limit=1))
+    
     response_text = yelp_json.get("response", {}).get("text", "")
     new_chat_id = yelp_json.get("chat_id") or request.chatId
 
-    # --- Persist conversation + prompt in Supabase ---
-    # For now we use a fixed user_id; later this can come from auth/session
-    user_id = "user_123"
+    async def persist_turn():
+        # --- Persist conversation + prompt in Supabase ---
+        # For now we use a fixed user_id; later this can come from auth/session
+        user_id = "user_123"
 
-    # Upsert conversation by chat_id
-    conversation_id = None
-    if new_chat_id:
-        conv_existing = (
-            db.table("conversations")
-            .select("id")
-            .eq("user_id", user_id)
-            .eq("chat_id", new_chat_id)
-            .limit(1)
-            .execute()
-        )
-        if conv_existing.data:
-            conversation_id = conv_existing.data[0]["id"]
-        else:
-            conv_insert = (
-                db.table("conversations")
-                .insert({"user_id": user_id, "chat_id": new_chat_id})
-                .execute()
+        # Resolve the conversation by chat_id; a new one is written together with the prompt
+        conversation_id = None
+        conversation_data = None
+        if new_chat_id:
+            conversation_id, conversation_data = await get_conversation_resolver().resolve(
+                db, new_chat_id, user_id, is_new=not request.chatId
             )
-            if conv_insert.data:
-                conversation_id = conv_insert.data[0]["id"]
 
-    # Insert prompt row with Yelp JSON response
-    try:
-        db.table("prompts").insert(
-            {
-                "conversation_id": conversation_id,
-                "user_id": user_id,
-                "prompt_text": request.message or "",
-                "prompt_type": "text",
-                "latitude": request.latitude,
-                "longitude": request.longitude,
-                "yelp_response": yelp_json,
-            }
-        ).execute()
-    except Exception:
-        # Don't fail the chat if logging to DB fails
-        pass
-    
-    # Extract businesses and fetch details
-    restaurant = None
-    restaurants = None
+        # Insert prompt row with Yelp JSON response
+        prompt_data = {
+            "id": str(uuid.uuid4()),
+            "conversation_id": conversation_id,
+            "user_id": user_id,
+            "prompt_text": request.message or "",
+            "prompt_type": "text",
+            "latitude": request.latitude,
+            "longitude": request.longitude,
+            "yelp_response": yelp_json,
+        }
+        try:
+            await record_prompt(conversation_data, prompt_data)
+        except Exception:
+            # Don't fail the chat if logging to DB fails
+            pass
     
     # Helper function to build Restaurant object from business data
     def build_restaurant(biz_data: dict, details_data: dict = None, include_contact: bool = False) -> Restaurant:
@@ -238,6 +296,31 @@ async def chat(request: ChatRequest, db=Depends(get_database)):
         
         business_id = biz_data.get("id") or (details_data.get("id") if details_data else "")
         
+        # Contact info and URL fall back to what the Yelp AI entity carries
+        address = None
+        phone = None
+        if include_contact:
+            address = (
+                ", ".join(details_data.get("location", {}).get("display_address", []))
+                if details_data else (biz_data.get("location") or {}).get("formatted_address")
+            )
+            phone = (
+                details_data.get("display_phone") or details_data.get("phone")
+                if details_data else biz_data.get("phone")
+            ) or None
+        url = (details_data.get("url") if details_data else None) or biz_data.get("url")
+        
+        missing_fields = [
+            field for field, known in [
+                ("time", time != "Check hours"),
+                ("imageUrl", bool(image_url)),
+                ("url", bool(url)),
+                ("address", bool(address) or not include_contact),
+                ("phone", bool(phone) or not include_contact),
+            ]
+            if not known
+        ]
+        
         return Restaurant(
             id=business_id,
             name=biz_data.get("name") or (details_data.get("name") if details_data else "Restaurant") or "Restaurant",
@@ -248,136 +331,160 @@ async def chat(request: ChatRequest, db=Depends(get_database)):
             summary=summary,
             imageUrl=image_url,
             vibes=vibes,
-            address=(
-                ", ".join(details_data.get("location", {}).get("display_address", []))
-                if include_contact and details_data else None
-            ),
-            phone=(
-                details_data.get("display_phone") or details_data.get("phone")
-                if include_contact and details_data else None
-            ),
-            url=details_data.get("url") if details_data else None,
+            address=address,
+            phone=phone,
+            url=url,
+            missingFields=missing_fields or None,
         )
     
-    # Handle different action types
-    if request.action == "yes" and request.businessId:
-        # User confirmed a restaurant - fetch full details
-        try:
-            details_response = requests.get(
-                f"https://api.yelp.com/v3/businesses/{request.businessId}",
-                headers={"Authorization": f"Bearer {yelp_service.api_key}"},
-                timeout=30
-            )
-            details_response.raise_for_status()
-            details = details_response.json()
-        except requests.exceptions.RequestException:
+    # "yes" (with a business) and "next" return a single card; anything else is a new query with up to 3
+    single_card = (request.action == "yes" and request.businessId) or request.action == "next"
+    lite_cards = (request.cardMode or DEFAULT_CARD_MODE) == "lite"
+
+    async def iter_cards():
+        """Yield (index, Restaurant) pairs as each card's details resolve."""
+        if single_card:
+            # User confirmed a restaurant - fetch full details, including contact info
+            include_contact = request.action == "yes"
+            if include_contact:
+                # The card the user saw, not whichever restaurant Yelp AI mentions in its reply
+                biz_data = find_business(yelp_json, request.businessId) or chosen or {"id": request.businessId}
+            else:
+                biz_list = pick_businesses(yelp_json, limit=1)
+                biz_data = biz_list[0] if biz_list else {}
+            business_id = request.businessId if include_contact else biz_data.get("id")
+            if not business_id:
+                return
             details = None
-        
-        biz = pick_businesses(yelp_json, limit=1)
-        biz_data = biz[0] if biz else {}
-        restaurant = build_restaurant(biz_data, details, include_contact=True)
-    
-    elif request.action == "next":
-        # User wants next option - return single restaurant
-        biz_list = pick_businesses(yelp_json, limit=1)
-        if biz_list:
-            biz_data = biz_list[0]
-            business_id = biz_data.get("id")
-            if business_id:
+            if not lite_cards:
                 try:
-                    details_response = requests.get(
-                        f"https://api.yelp.com/v3/businesses/{business_id}",
-                        headers={"Authorization": f"Bearer {yelp_service.api_key}"},
-                        timeout=30
-                    )
-                    details_response.raise_for_status()
-                    details = details_response.json()
-                except requests.exceptions.RequestException:
+                    details = await yelp_service.get_business_details(business_id)
+                except (httpx.HTTPError, CircuitOpenError):
                     details = None
-                
-                restaurant = build_restaurant(biz_data, details, include_contact=False)
-    
-    else:
-        # New query - return 3 restaurants for swipeable options
-        biz_list = pick_businesses(yelp_json, limit=3)
-        if biz_list:
-            restaurants_list = []
-            for biz_data in biz_list:
-                business_id = biz_data.get("id")
-                if business_id:
-                    try:
-                        details_response = requests.get(
-                            f"https://api.yelp.com/v3/businesses/{business_id}",
-                            headers={"Authorization": f"Bearer {yelp_service.api_key}"},
-                            timeout=30
-                        )
-                        details_response.raise_for_status()
-                        details = details_response.json()
-                    except requests.exceptions.RequestException:
-                        details = None
-                    
-                    rest = build_restaurant(biz_data, details, include_contact=False)
-                    restaurants_list.append(rest)
             
-            if restaurants_list:
-                restaurants = restaurants_list
-    
-    # Legacy single restaurant support (for backward compatibility)
-    if not restaurant and restaurants and len(restaurants) > 0:
-        restaurant = restaurants[0]
-    
-    session_id = request.sessionId or str(uuid.uuid4())
+            yield 0, build_restaurant(biz_data, details, include_contact=include_contact)
+        else:
+            # New query - fetch details concurrently; cards whose lookup misses the deadline use entity data only
+            biz_list = [biz for biz in pick_businesses(yelp_json, limit=3) if biz.get("id")]
+            if lite_cards:
+                for index, biz_data in enumerate(biz_list):
+                    yield index, build_restaurant(biz_data, None, include_contact=False)
+                return
+            
+            indexes_by_id = {}
+            for index, biz_data in enumerate(biz_list):
+                indexes_by_id.setdefault(biz_data["id"], []).append(index)
+            
+            async for business_id, details in yelp_service.iter_business_details(list(indexes_by_id)):
+                for index in indexes_by_id[business_id]:
+                    yield index, build_restaurant(biz_list[index], details, include_contact=False)
+
+    def build_response(cards: dict) -> ChatResponse:
+        ordered = [cards[index] for index in sorted(cards)]
+        restaurant = ordered[0] if single_card and ordered else None
+        restaurants = ordered if not single_card and ordered else None
+        
+        # Legacy single restaurant support (for backward compatibility)
+        if not restaurant and restaurants:
+            restaurant = restaurants[0]
+        
+        return ChatResponse(
+            chatId=new_chat_id or "",
+            message=response_text,
+            restaurant=restaurant,
+            restaurants=restaurants,
+            sessionId=session_id
+        )
+
+    if "text/event-stream" in http_request.headers.get("accept", ""):
+        # Persist in a task of its own so a client disconnecting mid-stream doesn't lose the turn
+        persist_task = asyncio.create_task(persist_turn())
+        _persist_tasks.add(persist_task)
+        persist_task.add_done_callback(_on_persist_done)
+        
+        async def event_stream():
+            # The message goes out as soon as Yelp AI answers; cards follow as their details arrive
+            yield sse_event("message", {"chatId": new_chat_id or "", "message": response_text, "sessionId": session_id})
+            
+            cards = {}
+            try:
+                async for index, card in iter_cards():
+                    cards[index] = card
+                    yield sse_event("restaurant", {"index": index, "restaurant": card.model_dump()})
+            except Exception as e:
+                # Always end the stream with a terminal event the client can act on
+                logger.error(f"Streaming chat cards failed: {str(e)}")
+                yield sse_event("error", {"detail": f"Failed to load restaurants: {str(e)}"})
+                return
+            
+            yield sse_event("done", build_response(cards).model_dump())
+        
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
     
-    return ChatResponse(
-        chatId=new_chat_id or "",
-        message=response_text,
-        restaurant=restaurant,
-        restaurants=restaurants,
-        sessionId=session_id
-    )
+    await persist_turn()
+    cards = {index: card async for index, card in iter_cards()}
+    return build_response(cards)
 
 
 @router.get("/history", response_model=List[ChatSummary])
-async def get_chat_history(db=Depends(get_database)):
-    """Return recent chat conversations for the current user."""
+async def get_chat_history(
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db=Depends(get_database)
+):
+    """
+    Return recent chat conversations for the current user, newest first.
+
+    Pages are keyset-paginated: when there are more conversations, the
+    X-Next-Cursor header carries the cursor to pass for the next page.
+    """
     user_id = "user_123"
 
-    conv_resp = (
-        db.table("conversations")
-        .select("id, chat_id, created_at")
-        .eq("user_id", user_id)
-        .order("created_at", desc=True)
-        .limit(20)
-        .execute()
-    )
+    before = None
+    if cursor:
+        try:
+            before = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid history cursor")
 
-    conversations = conv_resp.data or []
-
-    # Optionally fetch a short summary from the latest prompt per conversation
-    history: List[ChatSummary] = []
-    for conv in conversations:
-        last_prompt = (
-            db.table("prompts")
-            .select("prompt_text")
-            .eq("conversation_id", conv["id"])
-            .order("created_at", desc=True)
-            .limit(1)
-            .execute()
-        )
-        last_text = (
-            last_prompt.data[0]["prompt_text"]
-            if last_prompt.data
-            else None
-        )
+    # One round trip: conversations joined with their latest prompt in the database
+    rows = await db.chat_history(user_id, limit + 1, before)
 
-        history.append(
-            ChatSummary(
-                id=conv["id"],
-                chat_id=conv.get("chat_id"),
-                created_at=conv["created_at"],
-                last_message=last_text,
-            )
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+    return [
+        ChatSummary(
+            id=row["id"],
+            chat_id=row.get("chat_id"),
+            created_at=row["created_at"],
+            last_message=row.get("last_message"),
         )
+        for row in rows
+    ]
+
+
+@router.get("/prompts/{prompt_id}/yelp-response")
+async def get_prompt_yelp_response(prompt_id: str, db=Depends(get_database)):
+    """
+    Rehydrate the raw Yelp AI response stored for a prompt (for debugging and
+    replay): from the local archive when it still holds it, otherwise from
+    the prompt row.
+    """
+    digest = await db.get_prompt_response_hash(prompt_id)
+    if digest:
+        payload = await asyncio.to_thread(get_response_archive().load, digest)
+        if payload is not None:
+            return payload
 
-    return history
+    payload = await db.get_prompt_yelp_response(prompt_id)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="No stored response for this prompt")
+    return payload
 
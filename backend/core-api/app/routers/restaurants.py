@@ -1,12 +1,12 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from supabase import Client
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+from typing import List, Optional
 from datetime import datetime
 import base64
 import uuid
 import logging
 
 from app.deps.database import get_database
+from app.services.storage import Database
 from app.schemas import (
     TextPromptRequest,
     VoiceInputRequest,
@@ -16,7 +16,12 @@ from app.schemas import (
     Restaurant
 )
 from app.services.yelp_ai import get_yelp_ai_service
-from app.services.whisper_service import get_openai_whisper_service
+from app.services.whisper_service import get_openai_whisper_service, get_stt_service
+from app.services.circuit_breaker import ServiceUnavailableError
+from app.services.persistence import find_discovery, record_prompt, record_rows
+from app.services.conversations import get_conversation_resolver
+from app.services.preferences import get_preference_profiles
+from app.services.pagination import encode_cursor, decode_cursor
 
 logger = logging.getLogger(__name__)
 
@@ -24,58 +29,10 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/restaurants", tags=["restaurants"])
 
 
-def build_user_preference_context(db: Client, user_id: str) -> str:
-    """
-    Build hidden system context based on user's swipe history.
-    This context is prepended to the user's query to personalize recommendations.
-    """
-    try:
-        liked_swipes = db.table("user_swipes").select(
-            "restaurant_id, restaurants_discovered(name, cuisine, categories, price)"
-        ).eq("user_id", user_id).in_("action", ["right"]).limit(20).execute()
-        
-        disliked_swipes = db.table("user_swipes").select(
-            "restaurant_id, restaurants_discovered(name, cuisine, categories, price)"
-        ).eq("user_id", user_id).in_("action", ["left"]).limit(10).execute()
-        
-        context_parts = []
-        
-        if liked_swipes.data and len(liked_swipes.data) > 0:
-            liked_restaurants = [s.get("restaurants_discovered", {}) for s in liked_swipes.data if s.get("restaurants_discovered")]
-            if liked_restaurants:
-                names = list(set([r.get("name") for r in liked_restaurants if r.get("name")]))
-                cuisines = list(set([r.get("cuisine") for r in liked_restaurants if r.get("cuisine")]))
-                prices = list(set([r.get("price") for r in liked_restaurants if r.get("price")]))
-
-                if names:
-                    context_parts.append(f"User likes: {', '.join(list(set(names[:10])))}")
-                if cuisines:
-                    context_parts.append(f"User prefers: {', '.join(list(set(cuisines[:10])))} cuisine")
-                if prices:
-                    context_parts.append(f"Price range: {', '.join(prices)}")
-        
-        if disliked_swipes.data and len(disliked_swipes.data) > 0:
-            disliked_restaurants = [s.get("restaurants_discovered", {}) for s in disliked_swipes.data if s.get("restaurants_discovered")]
-            if disliked_restaurants:
-                names = list(set([r.get("name") for r in disliked_restaurants if r.get("name")]))
-                disliked_cuisines = list(set([r.get("cuisine") for r in disliked_restaurants if r.get("cuisine")]))
-                if names:
-                    context_parts.append(f"User dislikes: {', '.join(names[:3])}")
-        
-        if context_parts:
-            return "[HIDDEN CONTEXT: Here are the user's preferences, please find the restaurants that are not in these names but match the user's preferences: " + ". ".join(context_parts) + "]. "
-        
-        return ""
-
-    except Exception as e:
-        logger.warning(f"Failed to build preference context: {str(e)}")
-        return ""
-
-
 @router.post("/prompt/text")
 async def process_text_prompt(
     request: TextPromptRequest,
-    db: Client = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Process user text input and return restaurant recommendations.
@@ -91,42 +48,27 @@ async def process_text_prompt(
         yelp_service = get_yelp_ai_service()
         user_query = "\n\nUser query: " + request.text
 
-        preference_context = build_user_preference_context(db, request.user_id)
+        preference_context = await get_preference_profiles().build_context(db, request.user_id)
         enhanced_query = preference_context + user_query
         
         logger.info(f"Enhanced query with preferences: {enhanced_query}")
 
-        yelp_response = yelp_service.chat(
+        yelp_response = await yelp_service.achat(
             query=enhanced_query,
             latitude=request.latitude,
             longitude=request.longitude,
-            chat_id=request.chat_id
+            chat_id=request.chat_id,
+            use_cache=True
         )
         
         businesses = yelp_service.extract_businesses_from_response(yelp_response)
         
-        if request.chat_id:
-            result = db.table("conversations").select("id").eq("chat_id", request.chat_id).execute()
-            if result.data and len(result.data) > 0:
-                conversation_id = result.data[0]["id"]
-            else:
-                conversation_id = str(uuid.uuid4())
-                conversation_data = {
-                    "id": conversation_id,
-                    "user_id": request.user_id,
-                    "chat_id": yelp_response.get("chat_id"),
-                    "created_at": datetime.utcnow().isoformat()
-                }
-                db.table("conversations").insert(conversation_data).execute()
-        else:
-            conversation_id = str(uuid.uuid4())
-            conversation_data = {
-                "id": conversation_id,
-                "user_id": request.user_id,
-                "chat_id": yelp_response.get("chat_id"),
-                "created_at": datetime.utcnow().isoformat()
-            }
-            db.table("conversations").insert(conversation_data).execute()
+        conversation_id, conversation_data = await get_conversation_resolver().resolve(
+            db,
+            yelp_response.get("chat_id") or request.chat_id,
+            request.user_id,
+            is_new=not request.chat_id
+        )
         
         prompt_id = str(uuid.uuid4())
         
@@ -141,17 +83,18 @@ async def process_text_prompt(
             "yelp_response": yelp_response,
             "created_at": datetime.utcnow().isoformat()
         }
-        db.table("prompts").insert(prompt_data).execute()
 
-        for business in businesses:
-            restaurant_data = {
+        discovered_data = [
+            {
                 "id": str(uuid.uuid4()),
                 "prompt_id": prompt_id,
                 "user_id": request.user_id,
                 **business,
                 "created_at": datetime.utcnow().isoformat()
             }
-            db.table("restaurants_discovered").insert(restaurant_data).execute()
+            for business in businesses
+        ]
+        await record_prompt(conversation_data, prompt_data, discovered_data)
         
         logger.info(f"Found {len(businesses)} restaurants for user {request.user_id}")
         
@@ -164,6 +107,8 @@ async def process_text_prompt(
             "total_results": len(businesses)
         }
         
+    except ServiceUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error processing text prompt: {str(e)}")
         raise HTTPException(
@@ -176,7 +121,7 @@ async def process_text_prompt(
 @router.post("/prompt/textttt")
 async def process_text_promptsss(
     request: TextPromptRequest,
-    db: Client = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Process user text input and return restaurant recommendations.
@@ -192,42 +137,27 @@ async def process_text_promptsss(
         yelp_service = get_yelp_ai_service()
         user_query = "\n\nUser query: " + request.text
 
-        preference_context = build_user_preference_context(db, request.user_id)
+        preference_context = await get_preference_profiles().build_context(db, request.user_id)
         enhanced_query = preference_context + user_query
         
         logger.info(f"Enhanced query with preferences: {enhanced_query}")
 
-        yelp_response = yelp_service.chat(
+        yelp_response = await yelp_service.achat(
             query=enhanced_query,
             latitude=request.latitude,
             longitude=request.longitude,
-            chat_id=request.chat_id
+            chat_id=request.chat_id,
+            use_cache=True
         )
         
         businesses = yelp_service.extract_businesses_from_response(yelp_response)
         
-        if request.chat_id:
-            result = db.table("conversations").select("id").eq("chat_id", request.chat_id).execute()
-            if result.data and len(result.data) > 0:
-                conversation_id = result.data[0]["id"]
-            else:
-                conversation_id = str(uuid.uuid4())
-                conversation_data = {
-                    "id": conversation_id,
-                    "user_id": request.user_id,
-                    "chat_id": yelp_response.get("chat_id"),
-                    "created_at": datetime.utcnow().isoformat()
-                }
-                db.table("conversations").insert(conversation_data).execute()
-        else:
-            conversation_id = str(uuid.uuid4())
-            conversation_data = {
-                "id": conversation_id,
-                "user_id": request.user_id,
-                "chat_id": yelp_response.get("chat_id"),
-                "created_at": datetime.utcnow().isoformat()
-            }
-            db.table("conversations").insert(conversation_data).execute()
+        conversation_id, conversation_data = await get_conversation_resolver().resolve(
+            db,
+            yelp_response.get("chat_id") or request.chat_id,
+            request.user_id,
+            is_new=not request.chat_id
+        )
         
         prompt_id = str(uuid.uuid4())
         
@@ -242,17 +172,18 @@ async def process_text_promptsss(
             "yelp_response": yelp_response,
             "created_at": datetime.utcnow().isoformat()
         }
-        db.table("prompts").insert(prompt_data).execute()
 
-        for business in businesses:
-            restaurant_data = {
+        discovered_data = [
+            {
                 "id": str(uuid.uuid4()),
                 "prompt_id": prompt_id,
                 "user_id": request.user_id,
                 **business,
                 "created_at": datetime.utcnow().isoformat()
             }
-            db.table("restaurants_discovered").insert(restaurant_data).execute()
+            for business in businesses
+        ]
+        await record_prompt(conversation_data, prompt_data, discovered_data)
         
         logger.info(f"Found {len(businesses)} restaurants for user {request.user_id}")
         
@@ -265,6 +196,8 @@ async def process_text_promptsss(
             "total_results": len(businesses)
         }
         
+    except ServiceUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error processing text prompt: {str(e)}")
         raise HTTPException(
@@ -276,7 +209,7 @@ async def process_text_promptsss(
 @router.post("/prompt/voice")
 async def process_voice_input(
     request: VoiceInputRequest,
-    db: Client = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Process user voice input (base64 audio) and return restaurant recommendations.
@@ -293,7 +226,7 @@ async def process_voice_input(
         audio_bytes = base64.b64decode(request.audio_data)
 
         whisper_service = get_openai_whisper_service()
-        transcribed_text, detected_language = await whisper_service.transcribe_audio(audio_bytes)
+        transcribed_text, detected_language = await get_stt_service().transcribe_audio(audio_bytes)
         
         logger.info(f"Transcribed text ({detected_language}): {transcribed_text}")
         
@@ -305,43 +238,28 @@ async def process_voice_input(
         
         yelp_service = get_yelp_ai_service()
         
-        preference_context = build_user_preference_context(db, request.user_id)
+        preference_context = await get_preference_profiles().build_context(db, request.user_id)
         user_query = "\n\nUser query: " + transcribed_text
         enhanced_query = preference_context + user_query
         
         logger.info(f"Enhanced query with preferences: {enhanced_query}")
         
-        yelp_response = yelp_service.chat(
+        yelp_response = await yelp_service.achat(
             query=enhanced_query,
             latitude=request.latitude,
             longitude=request.longitude,
-            chat_id=request.chat_id
+            chat_id=request.chat_id,
+            use_cache=True
         )
         
         businesses = yelp_service.extract_businesses_from_response(yelp_response)
         
-        if request.chat_id:
-            result = db.table("conversations").select("id").eq("chat_id", request.chat_id).execute()
-            if result.data and len(result.data) > 0:
-                conversation_id = result.data[0]["id"]
-            else:
-                conversation_id = str(uuid.uuid4())
-                conversation_data = {
-                    "id": conversation_id,
-                    "user_id": request.user_id,
-                    "chat_id": yelp_response.get("chat_id"),
-                    "created_at": datetime.utcnow().isoformat()
-                }
-                db.table("conversations").insert(conversation_data).execute()
-        else:
-            conversation_id = str(uuid.uuid4())
-            conversation_data = {
-                "id": conversation_id,
-                "user_id": request.user_id,
-                "chat_id": yelp_response.get("chat_id"),
-                "created_at": datetime.utcnow().isoformat()
-            }
-            db.table("conversations").insert(conversation_data).execute()
+        conversation_id, conversation_data = await get_conversation_resolver().resolve(
+            db,
+            yelp_response.get("chat_id") or request.chat_id,
+            request.user_id,
+            is_new=not request.chat_id
+        )
         
         prompt_id = str(uuid.uuid4())
         
@@ -356,23 +274,24 @@ async def process_voice_input(
             "yelp_response": yelp_response,
             "created_at": datetime.utcnow().isoformat()
         }
-        db.table("prompts").insert(prompt_data).execute()
-        
-        for business in businesses:
-            restaurant_data = {
+
+        discovered_data = [
+            {
                 "id": str(uuid.uuid4()),
                 "prompt_id": prompt_id,
                 "user_id": request.user_id,
                 **business,
                 "created_at": datetime.utcnow().isoformat()
             }
-            db.table("restaurants_discovered").insert(restaurant_data).execute()
+            for business in businesses
+        ]
+        await record_prompt(conversation_data, prompt_data, discovered_data)
         
         logger.info(f"Found {len(businesses)} restaurants for user {request.user_id}")
         
         ai_text_response = yelp_response["response"]["text"]
         
-        ai_audio_response = whisper_service.text_to_speech(ai_text_response, voice=request.voice)
+        ai_audio_response = await whisper_service.text_to_speech(ai_text_response, voice=request.voice)
         ai_audio_base64 = base64.b64encode(ai_audio_response).decode()
         
         return {
@@ -387,6 +306,8 @@ async def process_voice_input(
             "total_results": len(businesses)
         }
 
+    except ServiceUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error processing voice input: {str(e)}")
         raise HTTPException(
@@ -397,20 +318,42 @@ async def process_voice_input(
 @router.get("/discover")
 async def restaurants_discovered(
     user_id: str = "user_123",
-    limit: int = 20,
-    db: Client = Depends(get_database)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Database = Depends(get_database)
 ):
     """
-    View all the discovered restaurants for a user that hasn't been swiped yet.
+    View the discovered restaurants for a user that haven't been swiped yet.
     
-    Returns restaurants ordered by most recently discovered.
+    Returns restaurants ordered by most recently discovered, one page at a time;
+    pass the returned next_cursor to get the following page.
     """
     try:
         logger.info(f"Fetching unswiped restaurants for user {user_id}")
         
-        all_discovered = db.table("restaurants_discovered").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
-        
-        if not all_discovered.data:
+        before = None
+        if cursor:
+            try:
+                before = decode_cursor(cursor)
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid discover cursor"
+                )
+        
+        # Anti-join, paging and counters are all done in the database in one call
+        result = await db.discover_unswiped(user_id, limit + 1, before)
+        unswiped_restaurants = result.get("restaurants") or []
+        
+        next_cursor = None
+        if len(unswiped_restaurants) > limit:
+            unswiped_restaurants = unswiped_restaurants[:limit]
+            last = unswiped_restaurants[-1]
+            next_cursor = encode_cursor(last["created_at"], last["id"])
+        
+        logger.info(f"Found {len(unswiped_restaurants)} unswiped restaurants out of {result.get('total_discovered', 0)} total")
+        
+        if not unswiped_restaurants and not cursor and not result.get("total_discovered"):
             return {
                 "success": True,
                 "restaurants": [],
@@ -418,31 +361,19 @@ async def restaurants_discovered(
                 "message": "No restaurants discovered yet"
             }
         
-        swiped_result = db.table("user_swipes").select("yelp_business_id").eq("user_id", user_id).execute()
-
-        swiped_business_ids = set()
-        if swiped_result.data:
-            swiped_business_ids = {swipe["yelp_business_id"] for swipe in swiped_result.data}
-        
-        unswiped_restaurants = [
-            restaurant for restaurant in all_discovered.data 
-            if restaurant["yelp_business_id"] not in swiped_business_ids
-        ]
-        
-        unswiped_restaurants = unswiped_restaurants[:limit]
-        
-        logger.info(f"Found {len(unswiped_restaurants)} unswiped restaurants out of {len(all_discovered.data)} total")
-        
         return {
             "success": True,
             "restaurants": unswiped_restaurants,
             "total": len(unswiped_restaurants),
-            "total_discovered": len(all_discovered.data),
-            "total_swiped": len(swiped_business_ids)
+            "total_discovered": result.get("total_discovered", 0),
+            "total_swiped": result.get("total_swiped", 0),
+            "next_cursor": next_cursor
         }
         
     except HTTPException:
         raise
+    except ServiceUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error handling discover: {str(e)}")
         raise HTTPException(
@@ -453,7 +384,7 @@ async def restaurants_discovered(
 @router.post("/swipe")
 async def handle_swipe(
     swipe: SwipeAction,
-    db: Client = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Handle swipe actions on restaurant cards.
@@ -467,15 +398,15 @@ async def handle_swipe(
         
         swipe_id = str(uuid.uuid4())
         
-        restaurant_result = db.table("restaurants_discovered").select("*").eq("yelp_business_id", swipe.yelp_business_id).execute()
+        # The user's most recent discovery of this business, with its catalog entry
+        restaurant = await find_discovery(db, swipe.user_id, swipe.yelp_business_id)
         
-        if not restaurant_result.data or len(restaurant_result.data) == 0:
+        if not restaurant:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Restaurant {swipe.yelp_business_id} not found"
             )
         
-        restaurant = restaurant_result.data[0]
         yelp_business_id = restaurant["yelp_business_id"]
         restaurant_id = restaurant["id"]
 
@@ -487,7 +418,7 @@ async def handle_swipe(
             "action": swipe.action,
             "created_at": datetime.utcnow().isoformat()
         }
-        db.table("user_swipes").insert(swipe_data).execute()
+        rows = {"user_swipes": [swipe_data]}
         
         if swipe.action in ["right"]:
             saved_id = str(uuid.uuid4())
@@ -500,9 +431,12 @@ async def handle_swipe(
                 "status": "saved",
                 "created_at": datetime.utcnow().isoformat()
             }
-            db.table("user_saved_restaurants").insert(saved_data).execute()
+            rows["user_saved_restaurants"] = [saved_data]
             logger.info(f"Restaurant {restaurant['name']} saved to My List")
         
+        await record_rows(rows)
+        get_preference_profiles().apply_swipe(swipe.user_id, swipe.action, restaurant)
+        
         return {
             "success": True,
             "action": swipe.action,
@@ -513,6 +447,8 @@ async def handle_swipe(
         
     except HTTPException:
         raise
+    except ServiceUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error handling swipe: {str(e)}")
         raise HTTPException(
@@ -524,7 +460,7 @@ async def handle_swipe(
 @router.post("/reservation/text")
 async def make_reservation_text(
     request: ReservationTextRequest,
-    db: Client = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Make a restaurant reservation using text input via Yelp AI.
@@ -535,42 +471,28 @@ async def make_reservation_text(
     try:
         logger.info(f"Processing reservation request for user {request.user_id}: {request.text}")
         
-        restaurant_result = db.table("restaurants_discovered").select("*").eq(
-            "yelp_business_id", request.yelp_business_id
-        ).execute()
+        restaurant = await find_discovery(db, request.user_id, request.yelp_business_id)
         
-        if not restaurant_result.data or len(restaurant_result.data) == 0:
+        if not restaurant:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Restaurant {request.yelp_business_id} not found"
             )
         
-        restaurant = restaurant_result.data[0]
-        
         reservation_prompt = f"I want to make a reservation at {restaurant['name']}. {request.text}"
         
         yelp_service = get_yelp_ai_service()
         
-        yelp_response = yelp_service.chat(
+        yelp_response = await yelp_service.achat(
             query=reservation_prompt,
             latitude=request.latitude,
             longitude=request.longitude,
             chat_id=request.chat_id
         )
 
-        conversation_result = db.table("conversations").select("id").eq("chat_id", request.chat_id).execute()
-        
-        if conversation_result.data and len(conversation_result.data) > 0:
-            conversation_id = conversation_result.data[0]["id"]
-        else:
-            conversation_id = str(uuid.uuid4())
-            conversation_data = {
-                "id": conversation_id,
-                "user_id": request.user_id,
-                "chat_id": request.chat_id,
-                "created_at": datetime.utcnow().isoformat()
-            }
-            db.table("conversations").insert(conversation_data).execute()
+        conversation_id, conversation_data = await get_conversation_resolver().resolve(
+            db, request.chat_id, request.user_id
+        )
         
         prompt_id = str(uuid.uuid4())
         prompt_data = {
@@ -584,7 +506,7 @@ async def make_reservation_text(
             "yelp_response": yelp_response,
             "created_at": datetime.utcnow().isoformat()
         }
-        db.table("prompts").insert(prompt_data).execute()
+        await record_prompt(conversation_data, prompt_data)
         
         logger.info(f"Reservation request processed via Yelp AI for {restaurant['name']}")
         
@@ -602,6 +524,8 @@ async def make_reservation_text(
         
     except HTTPException:
         raise
+    except ServiceUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error processing reservation: {str(e)}")
         raise HTTPException(
@@ -613,7 +537,7 @@ async def make_reservation_text(
 @router.post("/reservation/voice")
 async def make_reservation_voice(
     request: ReservationVoiceRequest,
-    db: Client = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Make a restaurant reservation using voice input via Yelp AI.
@@ -627,7 +551,7 @@ async def make_reservation_voice(
         audio_bytes = base64.b64decode(request.audio_data)
         
         whisper_service = get_openai_whisper_service()
-        transcribed_text, detected_language = await whisper_service.transcribe_audio(audio_bytes)
+        transcribed_text, detected_language = await get_stt_service().transcribe_audio(audio_bytes)
         
         logger.info(f"Transcribed reservation text ({detected_language}): {transcribed_text}")
         
@@ -637,42 +561,28 @@ async def make_reservation_voice(
                 detail="Could not transcribe audio. Please try again."
             )
         
-        restaurant_result = db.table("restaurants_discovered").select("*").eq(
-            "yelp_business_id", request.yelp_business_id
-        ).execute()
+        restaurant = await find_discovery(db, request.user_id, request.yelp_business_id)
         
-        if not restaurant_result.data or len(restaurant_result.data) == 0:
+        if not restaurant:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Restaurant {request.yelp_business_id} not found"
             )
         
-        restaurant = restaurant_result.data[0]
-        
         reservation_prompt = f"I want to make a reservation at {restaurant['name']}. {transcribed_text}"
         
         yelp_service = get_yelp_ai_service()
         
-        yelp_response = yelp_service.chat(
+        yelp_response = await yelp_service.achat(
             query=reservation_prompt,
             latitude=request.latitude,
             longitude=request.longitude,
             chat_id=request.chat_id
         )
         
-        conversation_result = db.table("conversations").select("id").eq("chat_id", request.chat_id).execute()
-        
-        if conversation_result.data and len(conversation_result.data) > 0:
-            conversation_id = conversation_result.data[0]["id"]
-        else:
-            conversation_id = str(uuid.uuid4())
-            conversation_data = {
-                "id": conversation_id,
-                "user_id": request.user_id,
-                "chat_id": request.chat_id,
-                "created_at": datetime.utcnow().isoformat()
-            }
-            db.table("conversations").insert(conversation_data).execute()
+        conversation_id, conversation_data = await get_conversation_resolver().resolve(
+            db, request.chat_id, request.user_id
+        )
         
         prompt_id = str(uuid.uuid4())
         prompt_data = {
@@ -686,11 +596,11 @@ async def make_reservation_voice(
             "yelp_response": yelp_response,
             "created_at": datetime.utcnow().isoformat()
         }
-        db.table("prompts").insert(prompt_data).execute()
+        await record_prompt(conversation_data, prompt_data)
         
         ai_text_response = yelp_response["response"]["text"]
         
-        ai_audio_response = whisper_service.text_to_speech(ai_text_response, voice=request.voice)
+        ai_audio_response = await whisper_service.text_to_speech(ai_text_response, voice=request.voice)
         ai_audio_base64 = base64.b64encode(ai_audio_response).decode()
         
         logger.info(f"Voice reservation request processed via Yelp AI for {restaurant['name']}")
@@ -712,6 +622,8 @@ async def make_reservation_voice(
         
     except HTTPException:
         raise
+    except ServiceUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error processing voice reservation: {str(e)}")
         raise HTTPException(
@@ -1,14 +1,20 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 from pydantic import BaseModel
-from typing import Optional, List
-import requests
+from typing import Optional, List, Literal
+import httpx
+import os
 import uuid
 import math
-from app.services.yelp_ai import YelpAIService
-from app.services.whisper_service import get_openai_whisper_service
+from app.services.yelp_ai import get_yelp_ai_service
+from app.services.circuit_breaker import CircuitOpenError, ServiceUnavailableError
+from app.services.candidates import get_candidate_queue, candidate_key, candidate_response
+from app.services.whisper_service import get_stt_service
 
 router = APIRouter(prefix="/api/talk", tags=["talk"])
 
+# "full" cards are enriched from /v3/businesses/{id}; "lite" cards use only the Yelp AI entity
+DEFAULT_CARD_MODE = os.getenv("CARD_MODE", "full")
+
 
 def pick_businesses(yelp_json: dict, limit: int = 3):
     """Extract businesses from Yelp AI response (up to limit)"""
@@ -19,6 +25,15 @@ def pick_businesses(yelp_json: dict, limit: int = 3):
     return businesses[:limit] if businesses else []
 
 
+def find_business(yelp_json: dict, business_id: Optional[str]) -> Optional[dict]:
+    """The entity for business_id in a Yelp AI response, if it is there"""
+    for entity in yelp_json.get("entities", []):
+        for biz in entity.get("businesses", []):
+            if business_id and biz.get("id") == business_id:
+                return biz
+    return None
+
+
 def haversine_miles(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """Calculate distance between two coordinates in miles"""
     R = 3958.8
@@ -45,6 +60,7 @@ class Restaurant(BaseModel):
     address: Optional[str] = None
     phone: Optional[str] = None
     url: Optional[str] = None
+    missingFields: Optional[List[str]] = None  # Fields not known without the details API (lite cards)
 
 
 class TalkResponse(BaseModel):
@@ -66,6 +82,7 @@ async def talk(
     sessionId: Optional[str] = Form(None),
     action: Optional[str] = Form(None),  # "yes", "next", or None
     businessId: Optional[str] = Form(None),
+    cardMode: Optional[Literal["full", "lite"]] = Form(None),  # Defaults to the CARD_MODE setting
 ):
     """Handle voice input with audio file, transcribe, and get restaurant recommendation"""
     try:
@@ -77,14 +94,18 @@ async def talk(
         if len(audio_bytes) > 0 and not action:
             # Transcribe audio using Whisper
             try:
-                whisper_service = get_openai_whisper_service()
-                transcript, _ = await whisper_service.transcribe_audio(audio_bytes)
+                stt_service = get_stt_service()
+                transcript, _ = await stt_service.transcribe_audio(
+                    audio_bytes, filename=file.filename or "audio.wav"
+                )
                 
                 if not transcript.strip():
                     raise HTTPException(
                         status_code=400,
                         detail="Could not transcribe audio. Please try again."
                     )
+            except ServiceUnavailableError:
+                raise
             except Exception as e:
                 import traceback
                 error_details = traceback.format_exc()
@@ -96,17 +117,25 @@ async def talk(
         
         # Initialize Yelp AI Service
         try:
-            yelp_service = YelpAIService()
+            yelp_service = get_yelp_ai_service()
         except ValueError as e:
             raise HTTPException(
                 status_code=500,
                 detail=str(e)
             )
         
+        new_session_id = sessionId or str(uuid.uuid4())
+        queue_key = candidate_key(new_session_id, chatId)
+        candidate_queue = get_candidate_queue()
+        
+        # The card the user said yes to; Yelp AI has not seen it if it came from the prefetch queue
+        chosen = candidate_queue.shown_business(queue_key, businessId) if action == "yes" else None
+        
         # Build query for Yelp AI based on action
         if action == "yes":
+            selected = chosen.get("name") if chosen else None
             query = (
-                "The user has selected this restaurant and wants to proceed. "
+                f"The user has selected {selected or 'this restaurant'} and wants to proceed. "
                 "Respond warmly and ask what they'd like to do next: make a reservation, get directions, or something else. "
                 "Keep your response brief and friendly - just one sentence asking what they'd like to do."
             )
@@ -121,19 +150,37 @@ async def talk(
                 )
             query = f"Recommend EXACTLY 3 restaurants that match the user's request.\nNo lists. No alternatives.\nKeep the 'why' to one sentence for each.\n\nUser: {transcript}"
         
-        try:
-            yelp_json = yelp_service.chat(
-                query=query,
-                latitude=latitude,
-                longitude=longitude,
-                chat_id=chatId,
-                locale=locale
-            )
-        except requests.exceptions.RequestException as e:
-            raise HTTPException(
-                status_code=502,
-                detail=f"Yelp AI API error: {str(e)}"
-            )
+        # "next" is served from the candidates prefetched for this session when there are any
+        candidate = None
+        if action == "next" and sessionId:
+            candidate = await candidate_queue.next_candidate(queue_key)
+        
+        if candidate is not None:
+            yelp_json = candidate_response(chatId, candidate)
+        else:
+            try:
+                yelp_json = await yelp_service.achat(
+                    query=query,
+                    latitude=latitude,
+                    longitude=longitude,
+                    chat_id=chatId,
+                    locale=locale,
+                    use_cache=not action
+                )
+            except httpx.HTTPError as e:
+                raise HTTPException(
+                    status_code=502,
+                    detail=f"Yelp AI API error: {str(e)}"
+                )
+            
+            shown_ids = [biz["id"] for biz in pick_businesses(yelp_json, limit=3) if biz.get("id")]
+            if not action:
+                candidate_queue.schedule_prefetch(
+                    yelp_service, candidate_key(new_session_id, yelp_json.get("chat_id") or chatId), yelp_json,
+                    shown_ids, transcript, latitude, longitude, locale
+                )
+            elif action == "next":
+                candidate_queue.mark_shown(queue_key, pick_businesses(yelp_json, limit=1))
         
         response_text = yelp_json.get("response", {}).get("text", "")
         yelp_chat_id = yelp_json.get("chat_id") or chatId or ""
@@ -208,6 +255,31 @@ async def talk(
             
             business_id = biz_data.get("id") or (details_data.get("id") if details_data else "")
             
+            # Contact info and URL fall back to what the Yelp AI entity carries
+            address = None
+            phone = None
+            if include_contact:
+                address = (
+                    ", ".join(details_data.get("location", {}).get("display_address", []))
+                    if details_data else (biz_data.get("location") or {}).get("formatted_address")
+                )
+                phone = (
+                    details_data.get("display_phone") or details_data.get("phone")
+                    if details_data else biz_data.get("phone")
+                ) or None
+            url = (details_data.get("url") if details_data else None) or biz_data.get("url")
+            
+            missing_fields = [
+                field for field, known in [
+                    ("time", time != "Check hours"),
+                    ("imageUrl", bool(image_url)),
+                    ("url", bool(url)),
+                    ("address", bool(address) or not include_contact),
+                    ("phone", bool(phone) or not include_contact),
+                ]
+                if not known
+            ]
+            
             return Restaurant(
                 id=business_id,
                 name=biz_data.get("name") or (details_data.get("name") if details_data else "Restaurant") or "Restaurant",
@@ -218,36 +290,28 @@ async def talk(
                 summary=summary,
                 imageUrl=image_url,
                 vibes=vibes,
-                address=(
-                    ", ".join(details_data.get("location", {}).get("display_address", []))
-                    if include_contact and details_data else None
-                ),
-                phone=(
-                    details_data.get("display_phone") or details_data.get("phone")
-                    if include_contact and details_data else None
-                ),
-                url=details_data.get("url") if details_data else None,
+                address=address,
+                phone=phone,
+                url=url,
+                missingFields=missing_fields or None,
             )
         
         # Handle different action types
         restaurant = None
         restaurants = None
+        lite_cards = (cardMode or DEFAULT_CARD_MODE) == "lite"
         
         if action == "yes" and businessId:
             # User confirmed a restaurant - fetch full details
-            try:
-                details_response = requests.get(
-                    f"https://api.yelp.com/v3/businesses/{businessId}",
-                    headers={"Authorization": f"Bearer {yelp_service.api_key}"},
-                    timeout=30
-                )
-                details_response.raise_for_status()
-                details = details_response.json()
-            except requests.exceptions.RequestException:
-                details = None
+            details = None
+            if not lite_cards:
+                try:
+                    details = await yelp_service.get_business_details(businessId)
+                except (httpx.HTTPError, CircuitOpenError):
+                    details = None
             
-            biz = pick_businesses(yelp_json, limit=1)
-            biz_data = biz[0] if biz else {}
+            # The card the user saw, not whichever restaurant Yelp AI mentions in its reply
+            biz_data = find_business(yelp_json, businessId) or chosen or {"id": businessId}
             restaurant = build_restaurant(biz_data, details, include_contact=True)
         
         elif action == "next":
@@ -257,40 +321,28 @@ async def talk(
                 biz_data = biz_list[0]
                 business_id = biz_data.get("id")
                 if business_id:
-                    try:
-                        details_response = requests.get(
-                            f"https://api.yelp.com/v3/businesses/{business_id}",
-                            headers={"Authorization": f"Bearer {yelp_service.api_key}"},
-                            timeout=30
-                        )
-                        details_response.raise_for_status()
-                        details = details_response.json()
-                    except requests.exceptions.RequestException:
-                        details = None
+                    details = None
+                    if not lite_cards:
+                        try:
+                            details = await yelp_service.get_business_details(business_id)
+                        except (httpx.HTTPError, CircuitOpenError):
+                            details = None
                     
                     restaurant = build_restaurant(biz_data, details, include_contact=False)
         
         else:
             # New query - return 3 restaurants for swipeable options
-            biz_list = pick_businesses(yelp_json, limit=3)
+            biz_list = [biz for biz in pick_businesses(yelp_json, limit=3) if biz.get("id")]
             if biz_list:
-                restaurants_list = []
-                for biz_data in biz_list:
-                    business_id = biz_data.get("id")
-                    if business_id:
-                        try:
-                            details_response = requests.get(
-                                f"https://api.yelp.com/v3/businesses/{business_id}",
-                                headers={"Authorization": f"Bearer {yelp_service.api_key}"},
-                                timeout=30
-                            )
-                            details_response.raise_for_status()
-                            details = details_response.json()
-                        except requests.exceptions.RequestException:
-                            details = None
-                        
-                        rest = build_restaurant(biz_data, details, include_contact=False)
-                        restaurants_list.append(rest)
+                # Fetch details concurrently; cards whose lookup misses the deadline use entity data only
+                details_by_id = (
+                    {} if lite_cards
+                    else await yelp_service.get_business_details_many([biz["id"] for biz in biz_list])
+                )
+                restaurants_list = [
+                    build_restaurant(biz_data, details_by_id.get(biz_data["id"]), include_contact=False)
+                    for biz_data in biz_list
+                ]
                 
                 if restaurants_list:
                     restaurants = restaurants_list
@@ -299,8 +351,6 @@ async def talk(
         if not restaurant and restaurants and len(restaurants) > 0:
             restaurant = restaurants[0]
         
-        new_session_id = sessionId or str(uuid.uuid4())
-        
         return TalkResponse(
             sessionId=new_session_id,
             transcript=transcript,
@@ -309,7 +359,7 @@ async def talk(
             restaurants=restaurants,
             restaurant=restaurant
         )
-    except HTTPException:
+    except (HTTPException, ServiceUnavailableError):
         raise
     except Exception as e:
         raise HTTPException(
@@ -1,11 +1,26 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
+import re
 from app.services.whisper_service import get_openai_whisper_service
+from app.services.circuit_breaker import ServiceUnavailableError
+from app.services.tts_cache import get_speech_cache
 
 router = APIRouter(prefix="/api/tts", tags=["tts"])
 
+# speech_cache_key() digests; anything else must never reach the disk cache's path lookup
+CACHE_KEY_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+CONTENT_TYPES = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/opus",
+    "aac": "audio/aac",
+    "flac": "audio/flac",
+    "wav": "audio/wav",
+    "pcm": "audio/pcm"
+}
+
 
 class TTSRequest(BaseModel):
     text: str
@@ -14,9 +29,56 @@ class TTSRequest(BaseModel):
     response_format: Optional[str] = "mp3"
 
 
+def speech_etag(cache_key: str) -> str:
+    # Weak: re-synthesizing the same inputs gives equivalent, not byte-identical, audio
+    return f'W/"{cache_key}"'
+
+
+def speech_url(response_format: str, cache_key: str) -> str:
+    return f"{router.prefix}/speech/{response_format}/{cache_key}"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against our ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in candidates)
+
+
+@router.get("/speech/{response_format}/{cache_key}")
+async def get_cached_speech(response_format: str, cache_key: str, if_none_match: Optional[str] = Header(None)):
+    """
+    Cached audio from an earlier POST /speech, at the URL that response gave
+    in Content-Location. Revalidate with If-None-Match to get a 304 instead of
+    the audio; a 404 means it is no longer cached and must be synthesized again.
+    """
+    if not CACHE_KEY_PATTERN.fullmatch(cache_key) or response_format not in CONTENT_TYPES:
+        raise HTTPException(status_code=404, detail="Speech is not cached")
+    
+    etag = speech_etag(cache_key)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    audio = await get_speech_cache().get(cache_key)
+    if audio is None:
+        raise HTTPException(status_code=404, detail="Speech is not cached")
+    return Response(
+        content=audio,
+        media_type=CONTENT_TYPES[response_format],
+        headers={"ETag": etag}
+    )
+
+
 @router.post("/speech")
 async def text_to_speech(request: TTSRequest):
-    """Convert text to speech using OpenAI TTS API"""
+    """
+    Convert text to speech using OpenAI TTS API, streaming audio as it is synthesized.
+    
+    Content-Location names a GET URL for the same audio, which serves it with
+    an ETag for revalidation once it is cached. Only cached (complete) audio
+    carries the ETag here; a stream still being synthesized could yet fail.
+    """
     try:
         if not request.text.strip():
             raise HTTPException(
@@ -25,14 +87,34 @@ async def text_to_speech(request: TTSRequest):
             )
         
         whisper_service = get_openai_whisper_service()
+        voice = request.voice or "coral"
+        response_format = request.response_format or "mp3"
+        
+        cache_key = whisper_service.speech_cache_key(request.text, voice, request.instructions, response_format)
+        content_type = CONTENT_TYPES.get(response_format, "audio/mpeg")
+        headers = {
+            "Content-Disposition": f'inline; filename="speech.{response_format}"',
+            "Content-Location": speech_url(response_format, cache_key)
+        }
+        
+        cached = await get_speech_cache().get(cache_key)
+        if cached is not None:
+            return Response(content=cached, media_type=content_type, headers={**headers, "ETag": speech_etag(cache_key)})
+        
+        audio_stream = whisper_service.stream_speech(
+            text=request.text,
+            voice=voice,
+            instructions=request.instructions,
+            response_format=response_format
+        )
         
         try:
-            audio_bytes = whisper_service.text_to_speech(
-                text=request.text,
-                voice=request.voice or "coral",
-                instructions=request.instructions,
-                response_format=request.response_format or "mp3"
-            )
+            # Wait for the first chunk so upstream failures still map to an error status
+            first_chunk = await audio_stream.__anext__()
+        except StopAsyncIteration:
+            first_chunk = b""
+        except ServiceUnavailableError:
+            raise
         except Exception as e:
             # Log the full error for debugging
             import traceback
@@ -43,25 +125,17 @@ async def text_to_speech(request: TTSRequest):
                 detail=f"TTS conversion failed: {str(e)}"
             )
         
-        # Determine content type based on format
-        content_type_map = {
-            "mp3": "audio/mpeg",
-            "opus": "audio/opus",
-            "aac": "audio/aac",
-            "flac": "audio/flac",
-            "wav": "audio/wav",
-            "pcm": "audio/pcm"
-        }
-        content_type = content_type_map.get(request.response_format or "mp3", "audio/mpeg")
+        async def audio_chunks():
+            try:
+                if first_chunk:
+                    yield first_chunk
+                async for chunk in audio_stream:
+                    yield chunk
+            finally:
+                await audio_stream.aclose()
         
-        return StreamingResponse(
-            iter([audio_bytes]),
-            media_type=content_type,
-            headers={
-                "Content-Disposition": f'inline; filename="speech.{request.response_format or "mp3"}"'
-            }
-        )
-    except HTTPException:
+        return StreamingResponse(audio_chunks(), media_type=content_type, headers=headers)
+    except (HTTPException, ServiceUnavailableError):
         raise
     except Exception as e:
         import traceback
@@ -0,0 +1,134 @@
+import os
+import tempfile
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DiskLRU:
+    """
+    Size-bounded blob cache on the local filesystem, evicted least-recently-used.
+
+    Blobs live at <root>/<first two hex digits>/<digest> and are written
+    through a temporary file that is renamed into place, so a blob is either
+    absent or complete. The LRU order is rebuilt from file mtimes at startup
+    and a hit touches the file, so recency survives restarts. All methods do
+    blocking file I/O.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _load_index(self) -> None:
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if len(name) != 64:
+                    # Temporary file left behind by a write that never finished
+                    os.unlink(path)
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_mtime, name, stat.st_size))
+
+        for _, digest, size in sorted(found):
+            self._index[digest] = size
+            self._bytes += size
+        with self._lock:
+            self._evict()
+        logger.info(f"Blob store at {self.root}: {len(self._index)} entries, {self._bytes} bytes")
+
+    def _touch(self, digest: str, size: int) -> None:
+        """Mark a blob found on disk as most recently used, indexing it if this process had not seen it."""
+        with self._lock:
+            if digest in self._index:
+                self._index.move_to_end(digest)
+                return
+            self._index[digest] = size
+            self._bytes += size
+            self._evict()
+
+    def _forget(self, digest: str) -> None:
+        with self._lock:
+            size = self._index.pop(digest, None)
+            if size is not None:
+                self._bytes -= size
+
+    def exists(self, digest: str) -> bool:
+        # The file, not the index, is the source of truth: other processes may share the directory
+        path = self._path(digest)
+        try:
+            os.utime(path)
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            self._forget(digest)
+            return False
+        self._touch(digest, size)
+        return True
+
+    def get(self, digest: str) -> Optional[bytes]:
+        path = self._path(digest)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self._forget(digest)
+            return None
+        self._touch(digest, len(data))
+        return data
+
+    def put(self, digest: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(digest)
+        with self._lock:
+            if digest in self._index and os.path.exists(path):
+                return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            if digest not in self._index:
+                self._index[digest] = len(data)
+                self._bytes += len(data)
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._index:
+            digest, size = self._index.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.unlink(self._path(digest))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._index),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
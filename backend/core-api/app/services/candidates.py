@@ -0,0 +1,206 @@
+import os
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.services.cache import TTLCache
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.yelp_ai import background_requests
+
+logger = logging.getLogger(__name__)
+
+
+PREFETCH_QUERY = (
+    "Recommend {count} restaurants that match the user's request, other than {shown}. "
+    "Keep the 'why' to one sentence for each.\n\nUser: {query}"
+)
+
+
+def candidate_key(session_id: str, chat_id: Optional[str]) -> str:
+    """Queues belong to one client session, never to a chat_id alone."""
+    return f"{session_id}:{chat_id or ''}"
+
+
+class CandidateQueue:
+    """
+    Per-session queue of restaurants to serve on "next".
+
+    Each candidate_key() gets a queue of raw Yelp AI business entities plus
+    the set of business ids already shown, so a "next" swipe can be answered
+    without another upstream round trip. The entities shown are remembered
+    too, so a "yes" can be rendered and named to Yelp AI from the card the
+    user actually saw. Sessions expire with the cache TTL.
+
+    Prefetching asks Yelp AI a separate first-turn question built from the
+    user's request, so it never adds a turn to the user's own conversation.
+    """
+
+    def __init__(self, max_sessions: int = 4096, ttl: float = 1800.0, prefetch_count: int = 5):
+        self.prefetch_count = prefetch_count
+        self._sessions = TTLCache(max_entries=max_sessions, ttl=ttl)
+        self._prefetches: Dict[str, asyncio.Task] = {}
+        self.served = 0
+        self.dry = 0
+
+    def _session(self, key: str) -> Dict[str, Any]:
+        session = self._sessions.get(key)
+        if session is None:
+            session = {"queue": deque(), "seen": set(), "shown": {}}
+            self._sessions.set(key, session)
+        return session
+
+    def mark_seen(self, key: str, business_ids: List[str]) -> None:
+        self._session(key)["seen"].update(business_ids)
+
+    def mark_shown(self, key: str, businesses: List[Dict[str, Any]]) -> None:
+        """Record entities that were put on a card, so a later "yes" can find them."""
+        session = self._session(key)
+        for biz in businesses:
+            if biz.get("id"):
+                session["seen"].add(biz["id"])
+                session["shown"][biz["id"]] = biz
+
+    def shown_business(self, key: str, business_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        session = self._sessions.get(key)
+        if session is None or not business_id:
+            return None
+        return session["shown"].get(business_id)
+
+    def push(self, key: str, businesses: List[Dict[str, Any]]) -> int:
+        session = self._session(key)
+        queued = {biz.get("id") for biz in session["queue"]}
+        added = 0
+        for biz in businesses:
+            business_id = biz.get("id")
+            if business_id and business_id not in session["seen"] and business_id not in queued:
+                session["queue"].append(biz)
+                queued.add(business_id)
+                added += 1
+        return added
+
+    def pop(self, key: str) -> Optional[Dict[str, Any]]:
+        session = self._sessions.get(key)
+        while session and session["queue"]:
+            biz = session["queue"].popleft()
+            if biz.get("id") not in session["seen"]:
+                session["seen"].add(biz.get("id"))
+                session["shown"][biz.get("id")] = biz
+                self.served += 1
+                return biz
+        return None
+
+    async def next_candidate(self, key: str, wait: float = 2.0) -> Optional[Dict[str, Any]]:
+        """
+        Pop the next candidate, waiting up to `wait` seconds for a prefetch
+        that is still in flight. Returns None when the queue is dry.
+        """
+        biz = self.pop(key)
+        prefetch = self._prefetches.get(key)
+        if biz is None and prefetch is not None:
+            await asyncio.wait([prefetch], timeout=wait)
+            biz = self.pop(key)
+        if biz is None:
+            self.dry += 1
+        return biz
+
+    def schedule_prefetch(
+        self,
+        yelp_service: Any,
+        key: str,
+        yelp_json: Dict[str, Any],
+        shown_ids: List[str],
+        user_query: str,
+        latitude: Optional[float],
+        longitude: Optional[float],
+        locale: str = "en_US"
+    ) -> None:
+        """Queue leftovers from the first answer and fetch more candidates in the background."""
+        businesses = _entity_businesses(yelp_json)
+        self.mark_seen(key, shown_ids)
+        self.mark_shown(key, [biz for biz in businesses if biz.get("id") in shown_ids])
+        self.push(key, businesses)
+        if key in self._prefetches or not user_query:
+            return
+        shown_names = [biz["name"] for biz in businesses if biz.get("id") in shown_ids and biz.get("name")]
+        query = PREFETCH_QUERY.format(
+            count=self.prefetch_count,
+            shown=", ".join(shown_names) or "the ones already suggested",
+            query=user_query
+        )
+        task = asyncio.create_task(self._prefetch(yelp_service, key, query, latitude, longitude, locale))
+        self._prefetches[key] = task
+        task.add_done_callback(lambda _: self._prefetches.pop(key, None))
+
+    async def _prefetch(
+        self,
+        yelp_service: Any,
+        key: str,
+        query: str,
+        latitude: Optional[float],
+        longitude: Optional[float],
+        locale: str
+    ) -> None:
+        try:
+            # Prefetching only spends rate limit that user requests leave over
+            with background_requests():
+                # No chat_id: a stateless question, so the user's conversation gets no extra turn
+                yelp_json = await yelp_service.achat(
+                    query=query,
+                    latitude=latitude,
+                    longitude=longitude,
+                    locale=locale
+                )
+                self.push(key, _entity_businesses(yelp_json))
+
+                # Pre-warm the details cache so served candidates need no round trip either
+                queued_ids = [biz["id"] for biz in self._session(key)["queue"]]
+                await yelp_service.get_business_details_many(queued_ids)
+            logger.info(f"Prefetched {len(queued_ids)} candidates for session {key}")
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            logger.warning(f"Candidate prefetch failed for session {key}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "prefetches_in_flight": len(self._prefetches),
+            "served": self.served,
+            "dry": self.dry,
+        }
+
+
+def _entity_businesses(yelp_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+    businesses = []
+    for entity in yelp_json.get("entities", []):
+        businesses.extend(entity.get("businesses", []))
+    return businesses
+
+
+def candidate_response(chat_id: Optional[str], biz: Dict[str, Any]) -> Dict[str, Any]:
+    """Wrap a queued candidate in the shape of a Yelp AI chat response."""
+    summary = (biz.get("summaries") or {}).get("short")
+    text = f"How about {biz.get('name', 'this place')}?"
+    if summary:
+        text = f"{text} {summary}"
+    return {
+        "chat_id": chat_id,
+        "response": {"text": text},
+        "entities": [{"businesses": [biz]}],
+        "prefetched": True,
+    }
+
+
+_candidate_queue: Optional[CandidateQueue] = None
+
+
+def get_candidate_queue() -> CandidateQueue:
+    global _candidate_queue
+    if _candidate_queue is None:
+        _candidate_queue = CandidateQueue(
+            max_sessions=int(os.getenv("CANDIDATE_QUEUE_SESSIONS", "4096")),
+            ttl=float(os.getenv("CANDIDATE_QUEUE_TTL", "1800")),
+            prefetch_count=int(os.getenv("CANDIDATE_PREFETCH_COUNT", "5"))
+        )
+    return _candidate_queue
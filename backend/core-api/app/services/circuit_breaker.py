@@ -0,0 +1,135 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ServiceUnavailableError(Exception):
+    """A dependency cannot take the request right now; answered with 503 and Retry-After."""
+
+    def __init__(self, message: str, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+class CircuitOpenError(ServiceUnavailableError):
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        super().__init__(f"{name} is temporarily unavailable (circuit open, retry in {retry_after:.0f}s)", retry_after)
+
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker.
+
+    After `failure_threshold` consecutive upstream failures the circuit opens
+    and calls fail fast with CircuitOpenError. Once `recovery_timeout` seconds
+    have passed it goes half-open and lets `half_open_max_calls` probe calls
+    through; a successful probe closes it again, a failed one reopens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        is_failure: Optional[Callable[[Exception], bool]] = None
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.is_failure = is_failure or (lambda e: True)
+        self.state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def _before_call(self) -> None:
+        if self.state == OPEN:
+            elapsed = time.monotonic() - self._opened_at
+            if elapsed < self.recovery_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.recovery_timeout - elapsed)
+            self.state = HALF_OPEN
+            logger.info(f"Circuit {self.name} half-open, probing upstream")
+
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_max_calls:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.recovery_timeout)
+            self._probes_in_flight += 1
+
+    def _record_success(self) -> None:
+        if self.state == HALF_OPEN:
+            logger.info(f"Circuit {self.name} closed, upstream recovered")
+        self.state = CLOSED
+        self._consecutive_failures = 0
+        self._probes_in_flight = 0
+
+    def _record_failure(self) -> None:
+        self._consecutive_failures += 1
+        if self.state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+                logger.warning(f"Circuit {self.name} opened after {self._consecutive_failures} consecutive failures")
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+            self._probes_in_flight = 0
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """Wrap one upstream call; raises CircuitOpenError instead of calling while open."""
+        self._before_call()
+        try:
+            yield
+        except Exception as e:
+            if self.is_failure(e):
+                self._record_failure()
+            else:
+                self._record_success()
+            raise
+        except BaseException:
+            # Cancelled: the call says nothing about upstream health
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            raise
+        else:
+            self._record_success()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(name: str, is_failure: Optional[Callable[[Exception], bool]] = None) -> CircuitBreaker:
+    if name not in _circuit_breakers:
+        _circuit_breakers[name] = CircuitBreaker(
+            name,
+            failure_threshold=int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5")),
+            recovery_timeout=float(os.getenv("CIRCUIT_BREAKER_RECOVERY_TIMEOUT", "30")),
+            is_failure=is_failure
+        )
+    return _circuit_breakers[name]
+
+
+def get_circuit_breaker_stats() -> Dict[str, Any]:
+    return {name: breaker.stats() for name, breaker in _circuit_breakers.items()}
@@ -0,0 +1,104 @@
+import os
+import json
+import uuid
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from app.services.cache import TTLCache
+from app.services.singleflight import SingleFlight
+from app.services.storage import Database
+
+logger = logging.getLogger(__name__)
+
+
+# Conversation ids for new chats are derived from the user and the Yelp AI
+# chat_id, so every process that creates the same conversation picks the same
+# primary key, while two users who end up with the same chat_id never share one
+CONVERSATION_NAMESPACE = uuid.UUID("5b0c2f4e-8d1a-4c3e-9f67-2a9e1d3b7c50")
+
+
+def conversation_id_for(user_id: str, chat_id: str) -> str:
+    return str(uuid.uuid5(CONVERSATION_NAMESPACE, json.dumps([user_id, chat_id])))
+
+
+class ConversationResolver:
+    """
+    Resolves a user's Yelp AI chat_id to its conversation row id.
+
+    Mappings are cached, so follow-up turns of a known chat need no query.
+    On a miss, concurrent turns of the same chat share one lookup. If no row
+    exists, the conversation gets the deterministic id conversation_id_for()
+    and the caller writes it with the prompt; since conversation inserts
+    ignore id conflicts, two turns (or two processes) racing to create the
+    same conversation end up with a single row.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600.0):
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._flight = SingleFlight()
+        self.lookups = 0
+        self.created = 0
+
+    async def resolve(
+        self,
+        db: Database,
+        chat_id: Optional[str],
+        user_id: str,
+        is_new: bool = False
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Return (conversation_id, conversation_data). conversation_data is the
+        row to write when the conversation is new, otherwise None. Pass
+        is_new=True for a chat_id Yelp AI just issued to skip the lookup.
+        """
+        if not chat_id:
+            conversation_id = str(uuid.uuid4())
+            return conversation_id, {"id": conversation_id, "user_id": user_id, "chat_id": None}
+
+        key = (user_id, chat_id)
+        conversation_id = self._cache.get(key)
+        if conversation_id is not None:
+            return conversation_id, None
+        if is_new:
+            return self._create(chat_id, user_id)
+        return await self._flight.do(key, lambda: self._lookup_or_create(db, chat_id, user_id))
+
+    async def _lookup_or_create(
+        self,
+        db: Database,
+        chat_id: str,
+        user_id: str
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        self.lookups += 1
+        conversation_id = await db.get_conversation_id(user_id, chat_id)
+        if conversation_id is None:
+            return self._create(chat_id, user_id)
+        self._cache.set((user_id, chat_id), conversation_id)
+        return conversation_id, None
+
+    def _create(self, chat_id: str, user_id: str) -> Tuple[str, Dict[str, Any]]:
+        conversation_id = conversation_id_for(user_id, chat_id)
+        self._cache.set((user_id, chat_id), conversation_id)
+        self.created += 1
+        return conversation_id, {"id": conversation_id, "user_id": user_id, "chat_id": chat_id}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._cache.stats(),
+            "lookups": self.lookups,
+            "created": self.created,
+            "single_flight": self._flight.stats(),
+        }
+
+
+_conversation_resolver: Optional[ConversationResolver] = None
+
+
+def get_conversation_resolver() -> ConversationResolver:
+    global _conversation_resolver
+    if _conversation_resolver is None:
+        _conversation_resolver = ConversationResolver(
+            max_entries=int(os.getenv("CONVERSATION_CACHE_SIZE", "10000")),
+            ttl=float(os.getenv("CONVERSATION_CACHE_TTL", "3600"))
+        )
+    return _conversation_resolver
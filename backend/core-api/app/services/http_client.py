@@ -0,0 +1,59 @@
+import os
+import logging
+import httpx
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_http_client(name: str, timeout: float) -> httpx.AsyncClient:
+    """A pooled async HTTP client with the HTTP_CLIENT_* connection settings and its own read timeout."""
+    http2 = os.getenv("HTTP_CLIENT_HTTP2", "true").lower() == "true" and _http2_available()
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("HTTP_CLIENT_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_CLIENT_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("HTTP_CLIENT_KEEPALIVE_EXPIRY", "30")),
+    )
+    client = httpx.AsyncClient(
+        http2=http2,
+        limits=limits,
+        timeout=httpx.Timeout(timeout, connect=float(os.getenv("HTTP_CLIENT_CONNECT_TIMEOUT", "5")))
+    )
+    logger.info(
+        f"Created {name} HTTP client (http2={http2}, max_connections={limits.max_connections}, "
+        f"max_keepalive={limits.max_keepalive_connections}, timeout={timeout}s)"
+    )
+    return client
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the process-wide async HTTP client for Yelp calls.
+
+    All Yelp calls share this client so connections (and TLS sessions) are
+    kept alive and reused instead of being opened per request. Other
+    upstreams with different timeouts get a client of their own from
+    create_http_client(), so closing one never tears down the other.
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = create_http_client("shared", float(os.getenv("HTTP_CLIENT_TIMEOUT", "30")))
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
@@ -0,0 +1,14 @@
+import uuid
+import base64
+from typing import Tuple
+
+
+def encode_cursor(created_at: str, row_id: str) -> str:
+    """Opaque keyset cursor for the (created_at, id) of the last row on a page."""
+    return base64.urlsafe_b64encode(f"{created_at}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverse of encode_cursor(). Raises ValueError for a malformed cursor."""
+    created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return created_at, str(uuid.UUID(row_id))
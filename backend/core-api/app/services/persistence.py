@@ -0,0 +1,133 @@
+import os
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.deps.database import get_database
+from app.services.storage import Database, PRIMARY_KEYS
+from app.services.spool import Spool
+from app.services.response_archive import get_response_archive, summarize_response
+from app.services.write_behind import WriteBehindQueue
+
+logger = logging.getLogger(__name__)
+
+
+# Per-prompt columns kept on restaurants_discovered; everything else belongs in the businesses catalog
+DISCOVERY_COLUMNS = ("id", "prompt_id", "user_id", "yelp_business_id", "ai_insight", "created_at")
+
+
+def _with_defaults(table: str, row: Dict[str, Any], now: str) -> Dict[str, Any]:
+    # jsonb_populate_recordset leaves omitted columns NULL rather than applying column defaults
+    if PRIMARY_KEYS.get(table, "id") == "id":
+        row = {"id": str(uuid.uuid4()), **row}
+    if table == "businesses":
+        row = {"updated_at": now, **row}
+    return {"created_at": now, **row}
+
+
+def split_discovery(discovered: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Split a discovered restaurant into its slim discovery row and its catalog entry."""
+    discovery = {key: value for key, value in discovered.items() if key in DISCOVERY_COLUMNS}
+    business = {
+        key: value for key, value in discovered.items()
+        if key not in DISCOVERY_COLUMNS or key == "yelp_business_id"
+    }
+    return discovery, business
+
+
+async def archive_prompt_response(prompt: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Add the archive digest and a short summary to a prompt row. The row keeps
+    the raw yelp_response: the local archive is best-effort, the database is
+    the durable copy.
+    """
+    prompt = dict(prompt)
+    yelp_response = prompt.get("yelp_response")
+    if yelp_response:
+        try:
+            prompt["yelp_response_hash"] = await asyncio.to_thread(get_response_archive().archive, yelp_response)
+        except OSError as e:
+            logger.warning(f"Response archive write failed: {e}")
+        prompt.update(summarize_response(yelp_response))
+    return prompt
+
+
+async def record_prompt(
+    conversation: Optional[Dict[str, Any]],
+    prompt: Dict[str, Any],
+    discovered: Optional[List[Dict[str, Any]]] = None
+) -> None:
+    """
+    Queue a new conversation (if any), the prompt and all discovered
+    restaurants (split into discovery rows and catalog entries) for the
+    write-behind writer. The prompt's raw Yelp AI response is also copied to
+    the response archive first. Returns once the rows are spooled to disk; they
+    reach the database on the next group commit.
+    """
+    if "yelp_response" in prompt:
+        prompt = await archive_prompt_response(prompt)
+
+    discoveries, businesses = [], []
+    for row in discovered or []:
+        discovery, business = split_discovery(row)
+        discoveries.append(discovery)
+        businesses.append(business)
+
+    await record_rows({
+        "conversations": [conversation] if conversation else [],
+        "prompts": [prompt],
+        "businesses": businesses,
+        "restaurants_discovered": discoveries,
+    })
+
+
+async def record_rows(rows_by_table: Dict[str, List[Dict[str, Any]]]) -> None:
+    """Queue rows for any tables through the write-behind writer."""
+    now = datetime.utcnow().isoformat()
+    await get_write_behind_queue().enqueue({
+        table: [_with_defaults(table, row, now) for row in rows]
+        for table, rows in rows_by_table.items()
+    })
+
+
+async def find_discovery(db: Database, user_id: str, yelp_business_id: str) -> Optional[Dict[str, Any]]:
+    """
+    db.get_latest_discovery() that sees the caller's own recent writes: on a
+    miss while rows are still spooled, wait (up to WRITE_BEHIND_READ_TIMEOUT
+    seconds) for the write-behind writer to commit them and look again.
+    """
+    restaurant = await db.get_latest_discovery(user_id, yelp_business_id)
+    queue = get_write_behind_queue()
+    if restaurant is None and queue.has_pending():
+        await queue.flush(float(os.getenv("WRITE_BEHIND_READ_TIMEOUT", "2")))
+        restaurant = await db.get_latest_discovery(user_id, yelp_business_id)
+    return restaurant
+
+
+async def write_rows(rows_by_table: Dict[str, List[Dict[str, Any]]]) -> None:
+    db = await get_database()
+    await db.write_rows(rows_by_table)
+
+
+_write_behind_queue: Optional[WriteBehindQueue] = None
+
+
+def get_write_behind_queue() -> WriteBehindQueue:
+    global _write_behind_queue
+    if _write_behind_queue is None:
+        _write_behind_queue = WriteBehindQueue(
+            writer=write_rows,
+            primary_keys=PRIMARY_KEYS,
+            spool=Spool(
+                directory=os.getenv("WRITE_BEHIND_SPOOL_DIR", "spool"),
+                fsync_interval=float(os.getenv("WRITE_BEHIND_FSYNC_INTERVAL_MS", "2")) / 1000
+            ),
+            flush_interval=float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL_MS", "5")) / 1000,
+            max_batch=int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500")),
+            max_spool_bytes=int(os.getenv("WRITE_BEHIND_SPOOL_MAX_BYTES", str(64 * 1024 * 1024))),
+            enqueue_timeout=float(os.getenv("WRITE_BEHIND_ENQUEUE_TIMEOUT", "5")),
+            max_attempts=int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "20"))
+        )
+    return _write_behind_queue
@@ -0,0 +1,126 @@
+import os
+import logging
+from typing import Any, Dict, List, Optional
+
+from app.services.cache import TTLCache
+from app.services.storage import Database
+
+logger = logging.getLogger(__name__)
+
+
+# Must match the caps in apply_swipe_to_profile() in supabase_schema.sql
+MAX_LIKED_NAMES = 20
+MAX_DISLIKED_NAMES = 10
+
+
+def empty_profile() -> Dict[str, Any]:
+    return {"liked_names": [], "disliked_names": [], "cuisine_counts": {}, "price_counts": {}}
+
+
+def _push_recent(names: List[str], name: str, cap: int) -> List[str]:
+    return ([name] + [n for n in names if n != name])[:cap]
+
+
+def apply_swipe(profile: Dict[str, Any], action: str, restaurant: Dict[str, Any]) -> None:
+    """Fold one swipe into a profile, the same way the database trigger does."""
+    name = restaurant.get("name")
+    if action == "right":
+        if name:
+            profile["liked_names"] = _push_recent(profile["liked_names"], name, MAX_LIKED_NAMES)
+        cuisine = restaurant.get("cuisine")
+        if cuisine:
+            profile["cuisine_counts"][cuisine] = profile["cuisine_counts"].get(cuisine, 0) + 1
+        price = restaurant.get("price")
+        if price:
+            profile["price_counts"][price] = profile["price_counts"].get(price, 0) + 1
+    elif action == "left" and name:
+        profile["disliked_names"] = _push_recent(profile["disliked_names"], name, MAX_DISLIKED_NAMES)
+
+
+def _most_common(counts: Dict[str, int], n: int) -> List[str]:
+    return [key for key, _ in sorted(counts.items(), key=lambda item: item[1], reverse=True)[:n]]
+
+
+def build_preference_context(profile: Dict[str, Any]) -> str:
+    """
+    Build hidden system context from a preference profile.
+    This context is prepended to the user's query to personalize recommendations.
+    """
+    context_parts = []
+
+    names = profile["liked_names"][:10]
+    cuisines = _most_common(profile["cuisine_counts"], 10)
+    prices = _most_common(profile["price_counts"], 4)
+    if names:
+        context_parts.append(f"User likes: {', '.join(names)}")
+    if cuisines:
+        context_parts.append(f"User prefers: {', '.join(cuisines)} cuisine")
+    if prices:
+        context_parts.append(f"Price range: {', '.join(prices)}")
+
+    disliked = profile["disliked_names"][:3]
+    if disliked:
+        context_parts.append(f"User dislikes: {', '.join(disliked)}")
+
+    if context_parts:
+        return "[HIDDEN CONTEXT: Here are the user's preferences, please find the restaurants that are not in these names but match the user's preferences: " + ". ".join(context_parts) + "]. "
+
+    return ""
+
+
+class PreferenceProfiles:
+    """
+    In-memory cache of per-user preference profiles.
+
+    The persisted profile (user_preference_profiles) is maintained by a
+    trigger on user_swipes. Cached profiles are updated in place on each
+    swipe handled by this process, so building prompt context is a cache
+    read; a profile is loaded from the database only on a cold miss.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 900.0):
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.loads = 0
+
+    async def get(self, db: Database, user_id: str) -> Dict[str, Any]:
+        profile = self._cache.get(user_id)
+        if profile is None:
+            profile = await self._load(db, user_id)
+            self._cache.set(user_id, profile)
+        return profile
+
+    async def _load(self, db: Database, user_id: str) -> Dict[str, Any]:
+        self.loads += 1
+        stored = await db.get_preference_profile(user_id)
+        profile = empty_profile()
+        if stored:
+            profile.update({key: value for key, value in stored.items() if value is not None})
+        return profile
+
+    def apply_swipe(self, user_id: str, action: str, restaurant: Dict[str, Any]) -> None:
+        profile = self._cache.get(user_id)
+        if profile is not None:
+            apply_swipe(profile, action, restaurant)
+
+    async def build_context(self, db: Database, user_id: str) -> str:
+        try:
+            return build_preference_context(await self.get(db, user_id))
+        except Exception as e:
+            logger.warning(f"Failed to build preference context: {str(e)}")
+            return ""
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "loads": self.loads}
+
+
+_preference_profiles: Optional[PreferenceProfiles] = None
+
+
+def get_preference_profiles() -> PreferenceProfiles:
+    global _preference_profiles
+    if _preference_profiles is None:
+        _preference_profiles = PreferenceProfiles(
+            max_entries=int(os.getenv("PREFERENCE_PROFILE_CACHE_SIZE", "10000")),
+            ttl=float(os.getenv("PREFERENCE_PROFILE_CACHE_TTL", "900"))
+        )
+    return _preference_profiles
@@ -0,0 +1,109 @@
+import time
+import random
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+
+class TokenBucket:
+    """
+    Async token-bucket limiter.
+
+    Tokens refill continuously at `rate` per second up to `burst`. Callers
+    queue on a lock, so waiting requests are released in arrival order.
+    Low-priority callers pass a `reserve` instead: they only take a token
+    while more than `reserve` tokens would be left, and they wait outside
+    the queue, so they never hold up the callers behind them.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.acquired = 0
+        self.waited = 0
+        self.rejected = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, timeout: Optional[float] = None, reserve: float = 0.0) -> bool:
+        """
+        Take one token, waiting for it if necessary.
+
+        Returns False without taking a token if it cannot be had within
+        `timeout` seconds.
+        """
+        if reserve > 0:
+            return await self._acquire_low_priority(timeout, min(reserve, self.burst - 1))
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                wait = (1 - self._tokens) / self.rate
+                if timeout is not None and wait > timeout:
+                    self.rejected += 1
+                    return False
+                self.waited += 1
+                await asyncio.sleep(wait)
+                self._refill()
+            self._tokens -= 1
+            self.acquired += 1
+            return True
+
+    async def _acquire_low_priority(self, timeout: Optional[float], reserve: float) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waited = False
+        while True:
+            async with self._lock:
+                self._refill()
+                if self._tokens >= 1 + reserve:
+                    self._tokens -= 1
+                    self.acquired += 1
+                    if waited:
+                        self.waited += 1
+                    return True
+                wait = (1 + reserve - self._tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                self.rejected += 1
+                return False
+            waited = True
+            await asyncio.sleep(wait)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "rejected": self.rejected,
+        }
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, base))
+    return delay
@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+
+import zstandard
+
+from app.services.blob_store import DiskLRU
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseArchive:
+    """
+    zstd-compressed archive of raw Yelp AI responses.
+
+    A payload is addressed by the SHA-256 of its canonical JSON encoding, so
+    identical responses (e.g. ones served from the chat response cache) are
+    stored once. Prompt rows record the digest; load() rehydrates the payload
+    for debugging or replay.
+
+    The archive is a best-effort local copy: the store is size-bounded and
+    evicts the least recently used blobs, and it is lost with the container.
+    Prompt rows keep the raw response until a durable blob backend replaces
+    the local store. load() returns None for an evicted digest.
+    """
+
+    def __init__(self, store: DiskLRU, level: int = 3):
+        self.store = store
+        self.level = level
+        self.archived = 0
+        self.deduplicated = 0
+        self.bytes_in = 0
+        self.bytes_stored = 0
+
+    def archive(self, payload: Dict[str, Any]) -> str:
+        """Store a payload (blocking file I/O) and return its digest."""
+        raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        self.bytes_in += len(raw)
+        if self.store.exists(digest):
+            self.deduplicated += 1
+            return digest
+
+        compressed = zstandard.ZstdCompressor(level=self.level).compress(raw)
+        self.store.put(digest, compressed)
+        self.archived += 1
+        self.bytes_stored += len(compressed)
+        return digest
+
+    def load(self, digest: str) -> Optional[Dict[str, Any]]:
+        compressed = self.store.get(digest)
+        if compressed is None:
+            return None
+        return json.loads(zstandard.ZstdDecompressor().decompress(compressed))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "archived": self.archived,
+            "deduplicated": self.deduplicated,
+            "bytes_in": self.bytes_in,
+            "bytes_stored": self.bytes_stored,
+            "compression_ratio": round(self.bytes_in / self.bytes_stored, 2) if self.bytes_stored else None,
+            "store": self.store.stats(),
+        }
+
+
+def summarize_response(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """The few fields of a Yelp AI response that prompt rows keep inline."""
+    business_ids = [
+        biz.get("id")
+        for entity in payload.get("entities", [])
+        for biz in entity.get("businesses", [])
+        if biz.get("id")
+    ]
+    return {
+        "response_text": (payload.get("response") or {}).get("text"),
+        "business_ids": business_ids,
+    }
+
+
+_response_archive: Optional[ResponseArchive] = None
+
+
+def get_response_archive() -> ResponseArchive:
+    """Process-wide archive; RESPONSE_ARCHIVE_MAX_BYTES caps the local store."""
+    global _response_archive
+    if _response_archive is None:
+        _response_archive = ResponseArchive(
+            DiskLRU(
+                os.getenv("RESPONSE_ARCHIVE_DIR", "archive"),
+                max_bytes=int(os.getenv("RESPONSE_ARCHIVE_MAX_BYTES", str(64 * 1024 * 1024)))
+            ),
+            level=int(os.getenv("RESPONSE_ARCHIVE_ZSTD_LEVEL", "3"))
+        )
+    return _response_archive
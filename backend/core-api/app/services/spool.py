@@ -0,0 +1,205 @@
+import os
+import json
+import zlib
+import fcntl
+import struct
+import asyncio
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Record header: payload length and CRC32 of the payload, both big-endian uint32
+HEADER = struct.Struct(">II")
+SEGMENT_SUFFIX = ".log"
+DEAD_LETTER_DIR = "dead"
+
+
+class Spool:
+    """
+    Append-only on-disk journal of pending writes.
+
+    Records are JSON payloads framed as [length][crc32][payload] and appended
+    to the active segment file. sync() batches fsyncs: callers that append
+    within `fsync_interval` seconds of each other share one fsync. rotate()
+    seals the active segment and starts a new one so sealed segments can be
+    replayed and deleted once their rows are in the database.
+
+    Several processes may share one spool directory. Each holds an exclusive
+    flock on its active segment for as long as it appends to it, and a
+    replayer must claim() a sealed segment (taking the same lock) before
+    reading or deleting it, so no process ever replays another's live
+    segment, and segments of a crashed process are picked up by the others.
+    """
+
+    def __init__(self, directory: str, fsync_interval: float = 0.002):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self._lock = asyncio.Lock()
+        self._sync_future: Optional[asyncio.Future] = None
+        self._fd: Optional[int] = None
+        self._active_path: Optional[str] = None
+        self._active_bytes = 0
+        self._size_bytes: Optional[int] = None
+        self.appended = 0
+        self.fsyncs = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_paths(self) -> List[str]:
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(SEGMENT_SUFFIX))
+        return [os.path.join(self.directory, n) for n in names]
+
+    def _open_segment(self) -> None:
+        paths = self._segment_paths()
+        seq = int(os.path.basename(paths[-1]).split("-")[0].split(".")[0]) + 1 if paths else 1
+        self._active_path = os.path.join(self.directory, f"{seq:012d}-{os.getpid()}{SEGMENT_SUFFIX}")
+        # Lock the file before it gets a segment name, so no replayer can claim it in between
+        pending_path = self._active_path + ".new"
+        self._fd = os.open(pending_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        os.rename(pending_path, self._active_path)
+        self._active_bytes = 0
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """Append one record to the active segment. Not durable until sync() returns."""
+        if self._fd is None:
+            self._open_segment()
+        data = _frame(record)
+        os.write(self._fd, data)
+        self._active_bytes += len(data)
+        if self._size_bytes is not None:
+            self._size_bytes += len(data)
+        self.appended += 1
+
+    async def sync(self) -> None:
+        """Wait until everything appended so far is fsynced, sharing the fsync with concurrent callers."""
+        if self._sync_future is None:
+            self._sync_future = asyncio.ensure_future(self._group_sync())
+        await asyncio.shield(self._sync_future)
+
+    async def _group_sync(self) -> None:
+        await asyncio.sleep(self.fsync_interval)
+        # Appends from here on need the next fsync
+        self._sync_future = None
+        async with self._lock:
+            if self._fd is not None:
+                await asyncio.to_thread(os.fsync, self._fd)
+                self.fsyncs += 1
+
+    async def rotate(self) -> List[str]:
+        """Seal the active segment (if it has data) and return all sealed segments, oldest first."""
+        async with self._lock:
+            if self._fd is not None and self._active_bytes:
+                sealed_fd = self._fd
+                # Open the new segment before closing the old one so appends never see a closed fd
+                self._open_segment()
+                await asyncio.to_thread(_fsync_and_close, sealed_fd)
+                self.fsyncs += 1
+        return [path for path in self._segment_paths() if path != self._active_path]
+
+    def pending_segments(self) -> List[str]:
+        """All segments still holding unwritten records, including the active one if it has data."""
+        return [
+            path for path in self._segment_paths()
+            if path != self._active_path or self._active_bytes
+        ]
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._fd is not None:
+                await asyncio.to_thread(_fsync_and_close, self._fd)
+                if not self._active_bytes:
+                    os.remove(self._active_path)
+                self._fd = None
+                self._active_path = None
+
+    def claim(self, path: str) -> Optional[int]:
+        """
+        Lock a sealed segment for replay. Returns a handle to pass to
+        release(), or None if another process holds it (its active segment,
+        or one it is replaying) or it is already gone.
+        """
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # The previous holder may have replayed and deleted it while we waited to open
+            if os.fstat(fd).st_ino != os.stat(path).st_ino:
+                raise FileNotFoundError(path)
+        except (BlockingIOError, FileNotFoundError):
+            os.close(fd)
+            return None
+        return fd
+
+    def release(self, handle: int) -> None:
+        os.close(handle)
+
+    def remove(self, path: str) -> None:
+        os.remove(path)
+        self._size_bytes = None
+
+    def dead_letter(self, path: str, records: List[Dict[str, Any]]) -> str:
+        """
+        Replace a sealed segment with a dead-letter segment holding only
+        `records`, outside the replay path. Moving the file back into the
+        spool directory replays it.
+        """
+        dead_path = os.path.join(self.directory, DEAD_LETTER_DIR, os.path.basename(path))
+        os.makedirs(os.path.dirname(dead_path), exist_ok=True)
+        fd = os.open(dead_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.write(fd, b"".join(_frame(record) for record in records))
+        finally:
+            _fsync_and_close(fd)
+        self.remove(path)
+        return dead_path
+
+    def size_bytes(self) -> int:
+        """Bytes in all segments; rescanned only after segments are removed."""
+        if self._size_bytes is None:
+            self._size_bytes = sum(self._segment_sizes())
+        return self._size_bytes
+
+    def _segment_sizes(self) -> List[int]:
+        return [entry.stat().st_size for entry in os.scandir(self.directory) if entry.name.endswith(SEGMENT_SUFFIX)]
+
+    def stats(self) -> Dict[str, Any]:
+        sizes = self._segment_sizes()
+        return {
+            "segments": len(sizes),
+            "bytes": sum(sizes),
+            "appended": self.appended,
+            "fsyncs": self.fsyncs,
+        }
+
+
+def _frame(record: Dict[str, Any]) -> bytes:
+    payload = json.dumps(record, separators=(",", ":"), default=str).encode("utf-8")
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _fsync_and_close(fd: int) -> None:
+    os.fsync(fd)
+    os.close(fd)
+
+
+def read_segment(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the records in a segment. A torn or corrupt record (a crash in the
+    middle of an append) ends the segment; nothing after it was acknowledged.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        length, crc = HEADER.unpack_from(data, offset)
+        payload = data[offset + HEADER.size:offset + HEADER.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            logger.warning(f"Discarding torn record at offset {offset} in spool segment {path}")
+            return
+        yield json.loads(payload)
+        offset += HEADER.size + length
@@ -0,0 +1,431 @@
+import json
+import sqlite3
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from app.services.preferences import apply_swipe, empty_profile
+from app.services.storage import Database, Keyset, PRIMARY_KEYS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+# Same tables as supabase_schema.sql, in SQLite types: UUIDs and timestamps are
+# ISO text, JSONB is JSON text, booleans are integers
+NOW = "(strftime('%Y-%m-%dT%H:%M:%f', 'now'))"
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL DEFAULT 'user_123',
+    chat_id TEXT,
+    created_at TEXT DEFAULT {NOW}
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_conversations_user_id_chat_id ON conversations(user_id, chat_id);
+CREATE INDEX IF NOT EXISTS idx_conversations_user_id_created_at ON conversations(user_id, created_at DESC, id DESC);
+
+CREATE TABLE IF NOT EXISTS prompts (
+    id TEXT PRIMARY KEY,
+    conversation_id TEXT REFERENCES conversations(id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL DEFAULT 'user_123',
+    prompt_text TEXT NOT NULL,
+    prompt_type TEXT CHECK (prompt_type IN ('text', 'voice')),
+    latitude REAL,
+    longitude REAL,
+    yelp_response TEXT,
+    yelp_response_hash TEXT,
+    response_text TEXT,
+    business_ids TEXT,
+    created_at TEXT DEFAULT {NOW}
+);
+CREATE INDEX IF NOT EXISTS idx_prompts_conversation_id_created_at ON prompts(conversation_id, created_at DESC);
+
+CREATE TABLE IF NOT EXISTS businesses (
+    yelp_business_id TEXT PRIMARY KEY,
+    alias TEXT,
+    name TEXT NOT NULL,
+    rating REAL,
+    review_count INTEGER,
+    price TEXT,
+    phone TEXT,
+    yelp_url TEXT,
+    image_url TEXT,
+    photos TEXT,
+    cuisine TEXT,
+    categories TEXT,
+    address TEXT,
+    address1 TEXT,
+    city TEXT,
+    state TEXT,
+    zip_code TEXT,
+    country TEXT,
+    latitude REAL,
+    longitude REAL,
+    business_url TEXT,
+    menu_url TEXT,
+    accepts_reservations INTEGER,
+    delivery_available INTEGER,
+    takeout_available INTEGER,
+    good_for_groups INTEGER,
+    good_for_kids INTEGER,
+    wheelchair_accessible INTEGER,
+    alcohol TEXT,
+    wifi TEXT,
+    has_tv INTEGER,
+    outdoor_seating INTEGER,
+    parking TEXT,
+    ambience TEXT,
+    noise_level TEXT,
+    price_range INTEGER,
+    created_at TEXT DEFAULT {NOW},
+    updated_at TEXT DEFAULT {NOW}
+);
+
+CREATE TABLE IF NOT EXISTS restaurants_discovered (
+    id TEXT PRIMARY KEY,
+    prompt_id TEXT REFERENCES prompts(id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL DEFAULT 'user_123',
+    yelp_business_id TEXT NOT NULL REFERENCES businesses(yelp_business_id),
+    ai_insight TEXT,
+    created_at TEXT DEFAULT {NOW}
+);
+CREATE INDEX IF NOT EXISTS idx_restaurants_discovered_user_id_created_at ON restaurants_discovered(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_restaurants_discovered_user_id_yelp_business_id ON restaurants_discovered(user_id, yelp_business_id, created_at DESC);
+
+CREATE TABLE IF NOT EXISTS user_swipes (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL DEFAULT 'user_123',
+    restaurant_id TEXT REFERENCES restaurants_discovered(id) ON DELETE CASCADE,
+    yelp_business_id TEXT NOT NULL,
+    action TEXT CHECK (action IN ('right', 'left')),
+    created_at TEXT DEFAULT {NOW}
+);
+CREATE INDEX IF NOT EXISTS idx_user_swipes_user_id_yelp_business_id ON user_swipes(user_id, yelp_business_id);
+
+CREATE TABLE IF NOT EXISTS user_saved_restaurants (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL DEFAULT 'user_123',
+    restaurant_id TEXT REFERENCES restaurants_discovered(id) ON DELETE CASCADE,
+    yelp_business_id TEXT NOT NULL,
+    swipe_type TEXT CHECK (swipe_type IN ('right', 'up')),
+    status TEXT CHECK (status IN ('saved', 'reserved', 'visited')) DEFAULT 'saved',
+    notes TEXT,
+    created_at TEXT DEFAULT {NOW},
+    updated_at TEXT DEFAULT {NOW}
+);
+CREATE INDEX IF NOT EXISTS idx_user_saved_restaurants_user_id ON user_saved_restaurants(user_id);
+
+CREATE TABLE IF NOT EXISTS reservations (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL DEFAULT 'user_123',
+    saved_restaurant_id TEXT REFERENCES user_saved_restaurants(id) ON DELETE CASCADE,
+    yelp_business_id TEXT NOT NULL,
+    party_size INTEGER NOT NULL,
+    reservation_time TEXT NOT NULL,
+    special_requests TEXT,
+    status TEXT CHECK (status IN ('pending', 'confirmed', 'cancelled')) DEFAULT 'pending',
+    created_at TEXT DEFAULT {NOW},
+    updated_at TEXT DEFAULT {NOW}
+);
+
+CREATE TABLE IF NOT EXISTS user_preferences (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL DEFAULT 'user_123' UNIQUE,
+    dietary_restrictions TEXT,
+    favorite_cuisines TEXT,
+    price_preference TEXT,
+    distance_preference REAL,
+    created_at TEXT DEFAULT {NOW},
+    updated_at TEXT DEFAULT {NOW}
+);
+
+CREATE TABLE IF NOT EXISTS user_preference_profiles (
+    user_id TEXT PRIMARY KEY,
+    liked_names TEXT NOT NULL DEFAULT '[]',
+    disliked_names TEXT NOT NULL DEFAULT '[]',
+    cuisine_counts TEXT NOT NULL DEFAULT '{{}}',
+    price_counts TEXT NOT NULL DEFAULT '{{}}',
+    updated_at TEXT DEFAULT {NOW}
+);
+
+CREATE TABLE IF NOT EXISTS user_discovery_counters (
+    user_id TEXT PRIMARY KEY,
+    discovered_count INTEGER NOT NULL DEFAULT 0,
+    swiped_count INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# JSON-valued columns, decoded when read back
+JSON_COLUMNS = {
+    "categories", "photos", "parking", "ambience", "business_ids", "yelp_response",
+    "liked_names", "disliked_names", "cuisine_counts", "price_counts",
+    "dietary_restrictions", "favorite_cuisines",
+}
+
+# Catalog columns joined onto each discovery so /discover keeps its full restaurant objects
+DISCOVERY_BUSINESS_COLUMNS = ", ".join(
+    f"b.{column}" for column in (
+        "alias", "name", "rating", "review_count", "price", "phone", "yelp_url", "image_url",
+        "photos", "cuisine", "categories", "address", "address1", "city", "state", "zip_code",
+        "country", "latitude", "longitude", "business_url", "menu_url", "accepts_reservations",
+        "delivery_available", "takeout_available", "good_for_groups", "good_for_kids",
+        "wheelchair_accessible", "alcohol", "wifi", "has_tv", "outdoor_seating", "parking",
+        "ambience", "noise_level", "price_range",
+    )
+)
+
+# Parents before children, like record_discoveries()
+WRITE_ORDER = ["conversations", "prompts", "businesses", "restaurants_discovered"]
+
+
+def _encode(value: Any) -> Any:
+    return json.dumps(value) if isinstance(value, (dict, list)) else value
+
+
+def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        key: json.loads(row[key]) if key in JSON_COLUMNS and row[key] is not None else row[key]
+        for key in row.keys()
+    }
+
+
+class SQLiteDatabase(Database):
+    """
+    Embedded Database for single-node deployments and load tests.
+
+    One connection is owned by a single worker thread, so queries never block
+    the event loop and never contend with each other. Writes that the
+    Postgres schema handles with triggers (preference profiles, discovery
+    counters) are applied in the same transaction as the rows they derive from.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._columns: Dict[str, List[str]] = {}
+
+    @classmethod
+    async def connect(cls, path: str) -> "SQLiteDatabase":
+        db = cls(path)
+        await db._run(db._open)
+        return db
+
+    async def _run(self, fn: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self) -> None:
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        tables = [row["name"] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        self._columns = {
+            table: [column["name"] for column in conn.execute(f"PRAGMA table_info({table})")]
+            for table in tables
+        }
+        self._conn = conn
+        logger.info(f"SQLite database ready at {self.path}")
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    # --- Writes ---
+
+    async def write_rows(self, rows_by_table: Dict[str, List[Dict[str, Any]]]) -> None:
+        await self._run(self._write_rows, rows_by_table)
+
+    def _write_rows(self, rows_by_table: Dict[str, List[Dict[str, Any]]]) -> None:
+        conn = self._conn
+        tables = [t for t in WRITE_ORDER if t in rows_by_table]
+        tables += [t for t in rows_by_table if t not in WRITE_ORDER]
+        now = datetime.utcnow()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in tables:
+                for row in rows_by_table[table]:
+                    if table == "businesses":
+                        self._upsert_business(row, now)
+                    elif self._insert(table, row):
+                        if table == "restaurants_discovered":
+                            self._bump_counter(row["user_id"], "discovered_count")
+                        elif table == "user_swipes":
+                            self._on_swipe_inserted(row)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _known(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        # Like jsonb_populate_recordset, ignore keys that are not columns
+        return {key: _encode(value) for key, value in row.items() if key in self._columns[table]}
+
+    def _insert(self, table: str, row: Dict[str, Any]) -> bool:
+        """Insert a row unless its primary key (or another unique key) exists. Returns whether it was inserted."""
+        values = self._known(table, row)
+        columns = ", ".join(values)
+        placeholders = ", ".join("?" for _ in values)
+        cursor = self._conn.execute(
+            f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) ON CONFLICT DO NOTHING",
+            list(values.values())
+        )
+        return cursor.rowcount == 1
+
+    def _upsert_business(self, row: Dict[str, Any], now: datetime) -> None:
+        # Refresh a catalog entry at most once a day, like record_discoveries()
+        values = self._known("businesses", row)
+        values["updated_at"] = now.isoformat()
+        columns = ", ".join(values)
+        placeholders = ", ".join("?" for _ in values)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in values if c not in ("yelp_business_id", "created_at"))
+        self._conn.execute(
+            f"INSERT INTO businesses ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT(yelp_business_id) DO UPDATE SET {updates} "
+            f"WHERE businesses.updated_at < ?",
+            list(values.values()) + [(now - timedelta(days=1)).isoformat()]
+        )
+
+    def _bump_counter(self, user_id: str, column: str) -> None:
+        self._conn.execute(
+            f"INSERT INTO user_discovery_counters (user_id, {column}) VALUES (?, 1) "
+            f"ON CONFLICT(user_id) DO UPDATE SET {column} = {column} + 1",
+            (user_id,)
+        )
+
+    def _on_swipe_inserted(self, swipe: Dict[str, Any]) -> None:
+        conn = self._conn
+        # Count distinct businesses: only the earliest swipe of a business counts
+        earlier = conn.execute(
+            "SELECT 1 FROM user_swipes WHERE user_id = ? AND yelp_business_id = ? "
+            "AND (created_at, id) < (?, ?) LIMIT 1",
+            (swipe["user_id"], swipe["yelp_business_id"], swipe["created_at"], swipe["id"])
+        ).fetchone()
+        if earlier is None:
+            self._bump_counter(swipe["user_id"], "swiped_count")
+
+        restaurant = conn.execute(
+            "SELECT b.name, b.cuisine, b.price FROM restaurants_discovered d "
+            "JOIN businesses b ON b.yelp_business_id = d.yelp_business_id WHERE d.id = ?",
+            (swipe.get("restaurant_id"),)
+        ).fetchone()
+        if restaurant is None:
+            return
+
+        profile = self._get_preference_profile(swipe["user_id"]) or empty_profile()
+        apply_swipe(profile, swipe["action"], dict(restaurant))
+        conn.execute(
+            "INSERT INTO user_preference_profiles "
+            "(user_id, liked_names, disliked_names, cuisine_counts, price_counts, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET "
+            "liked_names = excluded.liked_names, disliked_names = excluded.disliked_names, "
+            "cuisine_counts = excluded.cuisine_counts, price_counts = excluded.price_counts, "
+            "updated_at = excluded.updated_at",
+            (
+                swipe["user_id"],
+                json.dumps(profile["liked_names"]),
+                json.dumps(profile["disliked_names"]),
+                json.dumps(profile["cuisine_counts"]),
+                json.dumps(profile["price_counts"]),
+                datetime.utcnow().isoformat(),
+            )
+        )
+
+    # --- Reads ---
+
+    def _fetchone(self, sql: str, params: tuple) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(sql, params).fetchone()
+        return _decode(row) if row is not None else None
+
+    def _fetchall(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        return [_decode(row) for row in self._conn.execute(sql, params).fetchall()]
+
+    async def get_conversation_id(self, user_id: str, chat_id: str) -> Optional[str]:
+        row = await self._run(
+            self._fetchone,
+            "SELECT id FROM conversations WHERE user_id = ? AND chat_id = ? LIMIT 1",
+            (user_id, chat_id)
+        )
+        return row["id"] if row else None
+
+    def _get_preference_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return self._fetchone(
+            "SELECT liked_names, disliked_names, cuisine_counts, price_counts "
+            "FROM user_preference_profiles WHERE user_id = ?",
+            (user_id,)
+        )
+
+    async def get_preference_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._get_preference_profile, user_id)
+
+    async def get_latest_discovery(self, user_id: str, yelp_business_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(
+            self._fetchone,
+            "SELECT d.id, d.yelp_business_id, b.name, b.cuisine, b.price "
+            "FROM restaurants_discovered d JOIN businesses b ON b.yelp_business_id = d.yelp_business_id "
+            "WHERE d.user_id = ? AND d.yelp_business_id = ? "
+            "ORDER BY d.created_at DESC LIMIT 1",
+            (user_id, yelp_business_id)
+        )
+
+    async def discover_unswiped(self, user_id: str, limit: int, before: Keyset = None) -> Dict[str, Any]:
+        return await self._run(self._discover_unswiped, user_id, limit, before)
+
+    def _discover_unswiped(self, user_id: str, limit: int, before: Keyset) -> Dict[str, Any]:
+        before_created_at, before_id = before or (None, None)
+        restaurants = self._fetchall(
+            f"SELECT d.*, {DISCOVERY_BUSINESS_COLUMNS} "
+            "FROM restaurants_discovered d "
+            "JOIN businesses b ON b.yelp_business_id = d.yelp_business_id "
+            "WHERE d.user_id = ? "
+            "AND (? IS NULL OR (d.created_at, d.id) < (?, ?)) "
+            "AND NOT EXISTS ("
+            "    SELECT 1 FROM user_swipes s "
+            "    WHERE s.user_id = d.user_id AND s.yelp_business_id = d.yelp_business_id"
+            ") "
+            "ORDER BY d.created_at DESC, d.id DESC LIMIT ?",
+            (user_id, before_created_at, before_created_at, before_id, limit)
+        )
+        counters = self._fetchone(
+            "SELECT discovered_count, swiped_count FROM user_discovery_counters WHERE user_id = ?",
+            (user_id,)
+        ) or {}
+        return {
+            "restaurants": restaurants,
+            "total_discovered": counters.get("discovered_count", 0),
+            "total_swiped": counters.get("swiped_count", 0),
+        }
+
+    async def chat_history(self, user_id: str, limit: int, before: Keyset = None) -> List[Dict[str, Any]]:
+        before_created_at, before_id = before or (None, None)
+        return await self._run(
+            self._fetchall,
+            "SELECT c.id, c.chat_id, c.created_at, ("
+            "    SELECT p.prompt_text FROM prompts p WHERE p.conversation_id = c.id "
+            "    ORDER BY p.created_at DESC LIMIT 1"
+            ") AS last_message "
+            "FROM conversations c "
+            "WHERE c.user_id = ? AND (? IS NULL OR (c.created_at, c.id) < (?, ?)) "
+            "ORDER BY c.created_at DESC, c.id DESC LIMIT ?",
+            (user_id, before_created_at, before_created_at, before_id, limit)
+        )
+
+    async def get_prompt_response_hash(self, prompt_id: str) -> Optional[str]:
+        row = await self._run(
+            self._fetchone, "SELECT yelp_response_hash FROM prompts WHERE id = ?", (prompt_id,)
+        )
+        return row["yelp_response_hash"] if row else None
+
+    async def get_prompt_yelp_response(self, prompt_id: str) -> Optional[Dict[str, Any]]:
+        row = await self._run(
+            self._fetchone, "SELECT yelp_response FROM prompts WHERE id = ?", (prompt_id,)
+        )
+        return row["yelp_response"] if row else None
@@ -0,0 +1,60 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Tables whose primary key is not a generated "id"
+PRIMARY_KEYS = {
+    "businesses": "yelp_business_id",
+    "user_preference_profiles": "user_id",
+    "user_discovery_counters": "user_id",
+}
+
+# (created_at, id) of the last row of the previous page
+Keyset = Optional[Tuple[str, str]]
+
+
+class Database(ABC):
+    """
+    Storage interface used by the routers and services.
+
+    Every method is async so no implementation blocks the event loop. The
+    queries mirror supabase_schema.sql: implementations must keep the same
+    tables, deduplicate writes by primary key, and maintain the derived
+    tables (preference profiles, discovery counters) the schema's triggers
+    maintain.
+    """
+
+    @abstractmethod
+    async def write_rows(self, rows_by_table: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Insert rows for several tables; rows whose primary key already exists are skipped."""
+
+    @abstractmethod
+    async def get_conversation_id(self, user_id: str, chat_id: str) -> Optional[str]:
+        """The id of the user's conversation for a Yelp AI chat_id; chat_ids are not unique across users."""
+
+    @abstractmethod
+    async def get_preference_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_latest_discovery(self, user_id: str, yelp_business_id: str) -> Optional[Dict[str, Any]]:
+        """The user's most recent discovery row for a business, with the catalog's name, cuisine and price."""
+
+    @abstractmethod
+    async def discover_unswiped(self, user_id: str, limit: int, before: Keyset = None) -> Dict[str, Any]:
+        """A page of unswiped discoveries, each with its full catalog row, plus total_discovered / total_swiped counters."""
+
+    @abstractmethod
+    async def chat_history(self, user_id: str, limit: int, before: Keyset = None) -> List[Dict[str, Any]]:
+        """A page of conversations, newest first, each with its latest prompt as last_message."""
+
+    @abstractmethod
+    async def get_prompt_response_hash(self, prompt_id: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def get_prompt_yelp_response(self, prompt_id: str) -> Optional[Dict[str, Any]]:
+        """The raw Yelp AI response stored inline on a prompt row."""
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,33 @@
+"""
+Runs inside the local speech-to-text worker processes.
+
+Kept apart from whisper_service so spawned workers import only
+faster_whisper, not the API client stack.
+"""
+import io
+import os
+from typing import Any, Optional, Tuple
+
+_model: Any = None
+
+
+def init_worker(model_name: str, device: str, compute_type: str, cpu_threads: int, loaded: Any) -> None:
+    """
+    Pool initializer: load the model once per worker process, then release
+    the parent's `loaded` semaphore to report in.
+    """
+    global _model
+    from faster_whisper import WhisperModel
+
+    _model = WhisperModel(model_name, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+    loaded.release()
+
+
+def ready() -> int:
+    return os.getpid()
+
+
+def transcribe(audio: bytes, language: Optional[str], task: str, beam_size: int) -> Tuple[str, str]:
+    segments, info = _model.transcribe(io.BytesIO(audio), beam_size=beam_size, language=language, task=task)
+    text = " ".join(seg.text.strip() for seg in segments)
+    return text, info.language
@@ -0,0 +1,117 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+from supabase import AsyncClient, acreate_client
+
+from app.services.storage import Database, Keyset, PRIMARY_KEYS
+
+logger = logging.getLogger(__name__)
+
+
+# Tables record_discoveries() writes, mapped to its parameters
+DISCOVERY_TABLES = {
+    "conversations": "p_conversations",
+    "prompts": "p_prompts",
+    "restaurants_discovered": "p_restaurants",
+    "businesses": "p_businesses",
+}
+
+
+class SupabaseDatabase(Database):
+    """Database backed by Supabase/PostgREST through the async client."""
+
+    def __init__(self, client: AsyncClient):
+        self.client = client
+
+    @classmethod
+    async def connect(cls, url: str, key: str) -> "SupabaseDatabase":
+        return cls(await acreate_client(url, key))
+
+    async def write_rows(self, rows_by_table: Dict[str, List[Dict[str, Any]]]) -> None:
+        """
+        Conversations, prompts, businesses and discovered restaurants go out
+        together in one `record_discoveries` call; any other table gets one
+        bulk upsert that skips existing primary keys.
+        """
+        params = {
+            param: rows_by_table.get(table, [])
+            for table, param in DISCOVERY_TABLES.items()
+        }
+        if any(params.values()):
+            await self.client.rpc("record_discoveries", params).execute()
+
+        for table, rows in rows_by_table.items():
+            if table not in DISCOVERY_TABLES and rows:
+                await self.client.table(table).upsert(
+                    rows, on_conflict=PRIMARY_KEYS.get(table, "id"), ignore_duplicates=True
+                ).execute()
+
+    async def get_conversation_id(self, user_id: str, chat_id: str) -> Optional[str]:
+        result = await (
+            self.client.table("conversations")
+            .select("id")
+            .eq("user_id", user_id)
+            .eq("chat_id", chat_id)
+            .limit(1)
+            .execute()
+        )
+        return result.data[0]["id"] if result.data else None
+
+    async def get_preference_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        result = await (
+            self.client.table("user_preference_profiles")
+            .select("liked_names, disliked_names, cuisine_counts, price_counts")
+            .eq("user_id", user_id)
+            .limit(1)
+            .execute()
+        )
+        return result.data[0] if result.data else None
+
+    async def get_latest_discovery(self, user_id: str, yelp_business_id: str) -> Optional[Dict[str, Any]]:
+        result = await (
+            self.client.table("restaurants_discovered")
+            .select("id, yelp_business_id, businesses(name, cuisine, price)")
+            .eq("user_id", user_id)
+            .eq("yelp_business_id", yelp_business_id)
+            .order("created_at", desc=True)
+            .limit(1)
+            .execute()
+        )
+        if not result.data or not result.data[0].get("businesses"):
+            return None
+        discovery = result.data[0]
+        return {"id": discovery["id"], "yelp_business_id": discovery["yelp_business_id"], **discovery["businesses"]}
+
+    async def discover_unswiped(self, user_id: str, limit: int, before: Keyset = None) -> Dict[str, Any]:
+        params = {"p_user_id": user_id, "p_limit": limit}
+        if before:
+            params["p_before_created_at"], params["p_before_id"] = before
+        result = await self.client.rpc("discover_unswiped", params).execute()
+        return result.data or {}
+
+    async def chat_history(self, user_id: str, limit: int, before: Keyset = None) -> List[Dict[str, Any]]:
+        params = {"p_user_id": user_id, "p_limit": limit}
+        if before:
+            params["p_before_created_at"], params["p_before_id"] = before
+        result = await self.client.rpc("chat_history", params).execute()
+        return result.data or []
+
+    async def get_prompt_response_hash(self, prompt_id: str) -> Optional[str]:
+        result = await (
+            self.client.table("prompts")
+            .select("yelp_response_hash")
+            .eq("id", prompt_id)
+            .limit(1)
+            .execute()
+        )
+        return result.data[0].get("yelp_response_hash") if result.data else None
+
+    async def get_prompt_yelp_response(self, prompt_id: str) -> Optional[Dict[str, Any]]:
+        result = await (
+            self.client.table("prompts")
+            .select("yelp_response")
+            .eq("id", prompt_id)
+            .limit(1)
+            .execute()
+        )
+        return result.data[0].get("yelp_response") if result.data else None
@@ -0,0 +1,92 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+
+from app.services.blob_store import DiskLRU
+from app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def speech_cache_key(
+    model: str,
+    voice: str,
+    instructions: Optional[str],
+    response_format: Optional[str],
+    text: str
+) -> str:
+    """SHA-256 over everything that determines the synthesized audio."""
+    raw = json.dumps([model, voice, instructions, response_format, text], separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SpeechCache:
+    """
+    Two-tier cache of synthesized speech keyed by speech_cache_key().
+
+    The in-memory tier serves hot phrases (fixed action replies, common
+    confirmations); misses fall through to the disk tier, whose hits are
+    promoted back into memory. Audio larger than `max_entry_bytes` is not
+    cached.
+    """
+
+    def __init__(self, hot: TTLCache, disk: Optional[DiskLRU], max_entry_bytes: int):
+        self.hot = hot
+        self.disk = disk
+        self.max_entry_bytes = max_entry_bytes
+        self.disk_hits = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        audio = self.hot.get(key)
+        if audio is not None or self.disk is None:
+            return audio
+
+        audio = await asyncio.to_thread(self.disk.get, key)
+        if audio is not None:
+            self.disk_hits += 1
+            self.hot.set(key, audio)
+        return audio
+
+    async def put(self, key: str, audio: bytes) -> None:
+        if len(audio) > self.max_entry_bytes:
+            return
+        self.hot.set(key, audio)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.put, key, audio)
+            except OSError as e:
+                logger.warning(f"TTS disk cache write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory": self.hot.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+            "disk_hits": self.disk_hits,
+        }
+
+
+_speech_cache: Optional[SpeechCache] = None
+
+
+def get_speech_cache() -> SpeechCache:
+    """Process-wide speech cache; set TTS_CACHE_DIR to an empty string to keep it in memory only."""
+    global _speech_cache
+    if _speech_cache is None:
+        cache_dir = os.getenv("TTS_CACHE_DIR", "tts_cache")
+        _speech_cache = SpeechCache(
+            TTLCache(
+                max_entries=int(os.getenv("TTS_CACHE_SIZE", "256")),
+                ttl=float(os.getenv("TTS_CACHE_TTL", "86400")),
+                max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+                sizeof=len
+            ),
+            DiskLRU(
+                cache_dir,
+                max_bytes=int(os.getenv("TTS_CACHE_DISK_MAX_BYTES", str(32 * 1024 * 1024)))
+            ) if cache_dir else None,
+            max_entry_bytes=int(os.getenv("TTS_CACHE_MAX_ENTRY_BYTES", str(4 * 1024 * 1024)))
+        )
+    return _speech_cache
@@ -1,68 +1,219 @@
+import io
 import os
+import time
+import importlib.util
+import asyncio
 import tempfile
 import logging
-from openai import OpenAI
-from typing import Optional, Tuple, Any
+import threading
+import multiprocessing
+import httpx
+import openai
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from openai import AsyncOpenAI
+from typing import Optional, Tuple, Any, AsyncIterator, BinaryIO, Dict, Iterator, Union
+
+from app.services import stt_worker
+from app.services.circuit_breaker import CircuitOpenError, ServiceUnavailableError, get_circuit_breaker
+from app.services.http_client import create_http_client
+from app.services.tts_cache import get_speech_cache, speech_cache_key
 
 logger = logging.getLogger(__name__)
 
+# Uploads larger than this are spilled to an anonymous temp file instead of held in memory
+STT_SPILL_THRESHOLD_BYTES = int(os.getenv("STT_SPILL_THRESHOLD_BYTES", str(16 * 1024 * 1024)))
+
+# Size of the pieces streamed TTS audio is forwarded in
+TTS_STREAM_CHUNK_BYTES = int(os.getenv("TTS_STREAM_CHUNK_BYTES", "4096"))
+
+AudioInput = Union[bytes, bytearray, memoryview]
+
+
+@contextmanager
+def audio_file(audio: AudioInput, spill_threshold: int = STT_SPILL_THRESHOLD_BYTES) -> Iterator[BinaryIO]:
+    """
+    File-like view of uploaded audio for the STT backends, without touching
+    the filesystem unless the upload is above `spill_threshold` bytes.
+    """
+    if memoryview(audio).nbytes <= spill_threshold:
+        yield io.BytesIO(audio)
+        return
+
+    # Unnamed temp file: removed by the OS as soon as it is closed
+    with tempfile.TemporaryFile() as spill:
+        spill.write(audio)
+        spill.seek(0)
+        yield spill
+
+
+class STTBusyError(ServiceUnavailableError):
+    """The local STT queue stayed full."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Local speech-to-text is busy, retry in {retry_after:.0f}s", retry_after)
+
+
+def _wait_for_workers(loaded: Any, count: int, timeout: float, abandoned: threading.Event) -> int:
+    """Block until `count` workers have released `loaded`; returns how many did."""
+    deadline = time.monotonic() + timeout
+    reported = 0
+    while reported < count and not abandoned.is_set() and time.monotonic() < deadline:
+        if loaded.acquire(timeout=0.25):
+            reported += 1
+    return reported
+
 
 class WhisperService:
+    """
+    Local faster-whisper speech-to-text on a pool of worker processes.
+
+    start() spawns the workers and returns once every one of them has loaded
+    the model (or fails after `start_timeout` seconds), so requests never pay
+    the load and transcription never runs on the event loop. At
+    most `workers + queue_size` transcriptions are admitted at a time; further
+    callers wait up to `queue_timeout` seconds for a slot and then fail with
+    STTBusyError.
+    """
+
     def __init__(
         self,
         model_name: str = "base",
         device: str = "cpu",
-        compute_type: str = "int8"
+        compute_type: str = "int8",
+        workers: int = 1,
+        cpu_threads: int = 0,
+        queue_size: int = 16,
+        queue_timeout: float = 10.0,
+        beam_size: int = 5,
+        start_timeout: float = 300.0
     ):
         self.model_name = model_name
         self.device = device
         self.compute_type = compute_type
-        self._model = None
+        self.workers = workers
+        self.cpu_threads = cpu_threads
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.beam_size = beam_size
+        self.start_timeout = start_timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._start_lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(workers + queue_size)
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
     
-    def _get_model(self) -> Any:
-        if self._model is None:
-            logger.info(f"Loading Whisper model '{self.model_name}' on {self.device}")
-            self._model = WhisperModel(
-                self.model_name,
-                device=self.device,
-                compute_type=self.compute_type
+    async def start(self) -> None:
+        async with self._start_lock:
+            if self._executor is not None:
+                return
+            if importlib.util.find_spec("faster_whisper") is None:
+                raise RuntimeError("STT_BACKEND=local needs faster-whisper: pip install -r app/requirements-local-stt.txt")
+            
+            logger.info(
+                f"Starting {self.workers} local STT workers: model '{self.model_name}' "
+                f"({self.compute_type}) on {self.device}, {self.cpu_threads or 'auto'} threads each"
             )
-        return self._model
+            # spawn, not fork: the parent has an event loop and threads running
+            ctx = multiprocessing.get_context("spawn")
+            loaded = ctx.Semaphore(0)
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=ctx,
+                initializer=stt_worker.init_worker,
+                initargs=(self.model_name, self.device, self.compute_type, self.cpu_threads, loaded)
+            )
+            # One task per worker makes the pool spawn all of them now; each
+            # worker releases `loaded` once its model is in memory
+            loop = asyncio.get_running_loop()
+            abandoned = threading.Event()
+            spawned = asyncio.gather(*(
+                loop.run_in_executor(executor, stt_worker.ready) for _ in range(self.workers)
+            ))
+            waiter = asyncio.ensure_future(asyncio.to_thread(
+                _wait_for_workers, loaded, self.workers, self.start_timeout, abandoned
+            ))
+            try:
+                done, _ = await asyncio.wait({spawned, waiter}, return_when=asyncio.FIRST_EXCEPTION)
+                if spawned in done:
+                    # Raises BrokenProcessPool if a worker died while loading the model
+                    spawned.result()
+                reported = await waiter
+                if reported < self.workers:
+                    raise RuntimeError(
+                        f"Only {reported} of {self.workers} local STT workers loaded the model "
+                        f"within {self.start_timeout}s"
+                    )
+            except BaseException:
+                abandoned.set()
+                spawned.cancel()
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+            self._executor = executor
+            logger.info("Local STT workers ready")
+    
+    async def stop(self) -> None:
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
     
     async def transcribe_audio(
         self,
-        audio_bytes: bytes,
+        audio_bytes: AudioInput,
         language: Optional[str] = None,
-        task: str = "transcribe"
+        task: str = "transcribe",
+        filename: str = "audio.wav"
     ) -> Tuple[str, str]:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-            tmp.write(audio_bytes)
-            tmp.flush()
-            temp_path = tmp.name
+        # `filename` is accepted for parity with OpenAIWhisperService; the decoder sniffs the format
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise STTBusyError(self.queue_timeout)
         
+        executor = None
+        self.in_flight += 1
         try:
-            model = self._get_model()
-            
-            segments, info = model.transcribe(
-                temp_path,
-                beam_size=5,
-                language=language,
-                task=task
+            if self._executor is None:
+                await self.start()
+            executor = self._executor
+            text, detected_language = await asyncio.get_running_loop().run_in_executor(
+                executor, stt_worker.transcribe, bytes(audio_bytes), language, task, self.beam_size
             )
-            
-            text = " ".join(seg.text.strip() for seg in segments)
-            
-            logger.info(f"Transcription completed: {len(text)} characters, language: {info.language}")
-            
-            return text, info.language
-            
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); the next call starts a fresh pool
+            self.failed += 1
+            if executor is not None and self._executor is executor:
+                logger.error("Local STT worker pool broke, restarting it on the next request")
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
         except Exception as e:
+            self.failed += 1
             logger.error(f"Transcription failed: {e}")
             raise
-            
         finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            self.in_flight -= 1
+            self._slots.release()
+        
+        self.completed += 1
+        logger.info(f"Transcription completed: {len(text)} characters, language: {detected_language}")
+        
+        return text, detected_language
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "model": self.model_name,
+            "max_admitted": self.workers + self.queue_size,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
 
 
 class OpenAIWhisperService:
@@ -72,24 +223,31 @@ class OpenAIWhisperService:
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable is required")
-        self.client = OpenAI(api_key=api_key)
+        # Async client on a connection pool of its own, so STT/TTS calls overlap instead of blocking
+        # the loop, get audio-length timeouts, and closing it never touches the Yelp pool
+        timeout = float(os.getenv("OPENAI_AUDIO_TIMEOUT", "60"))
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            http_client=create_http_client("openai", timeout),
+            timeout=timeout
+        )
+    
+    async def close(self) -> None:
+        await self.client.close()
     
     async def transcribe_audio(
         self,
-        audio_bytes: bytes,
+        audio_bytes: AudioInput,
         language: Optional[str] = None,
-        response_format: str = "json"
+        response_format: str = "json",
+        filename: str = "audio.wav"
     ) -> Tuple[str, str]:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-            tmp.write(audio_bytes)
-            tmp.flush()
-            temp_path = tmp.name
-        
         try:
-            with open(temp_path, "rb") as audio_file:
-                transcription = self.client.audio.transcriptions.create(
+            # The filename's extension tells the API which audio format it is getting
+            with audio_file(audio_bytes) as audio, get_circuit_breaker("openai_stt", is_openai_failure).guard():
+                transcription = await self.client.audio.transcriptions.create(
                     model=self.model_name,
-                    file=audio_file,
+                    file=(filename, audio),
                     response_format=response_format,
                     language=language
                 )
@@ -108,12 +266,8 @@ class OpenAIWhisperService:
         except Exception as e:
             logger.error(f"OpenAI Whisper transcription failed: {e}")
             raise
-            
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
     
-    def text_to_speech(
+    async def text_to_speech(
         self,
         text: str,
         voice: str = "coral",
@@ -126,28 +280,30 @@ class OpenAIWhisperService:
         Available voices: alloy, ash, ballad, coral, echo, fable, nova, onyx, sage, shimmer
         Model: gpt-4o-mini-tts
         """
+        cache_key = self.speech_cache_key(text, voice, instructions, response_format)
+        cached = await get_speech_cache().get(cache_key)
+        if cached is not None:
+            logger.info(f"TTS cache hit: {len(cached)} bytes")
+            return cached
+        
         try:
             logger.info(f"Converting text to speech: {len(text)} characters, voice: {voice}")
             
-            # Build base parameters
-            params = {
-                "model": self.tts_model,
-                "voice": voice,
-                "input": text,
-            }
+            params = self._speech_params(text, voice, instructions, response_format)
             
-            # Add response_format if specified
-            if response_format:
-                params["response_format"] = response_format
-            
-            response = self.client.audio.speech.create(**params)
+            with get_circuit_breaker("openai_tts", is_openai_failure).guard():
+                response = await self.client.audio.speech.create(**params)
             
             audio_bytes = response.content
             
             logger.info(f"TTS conversion completed: {len(audio_bytes)} bytes")
             
+            await get_speech_cache().put(cache_key, audio_bytes)
+            
             return audio_bytes
             
+        except CircuitOpenError:
+            raise
         except Exception as e:
             error_msg = str(e)
             logger.error(f"TTS conversion failed: {error_msg}")
@@ -155,6 +311,84 @@ class OpenAIWhisperService:
             if "messages" in error_msg.lower():
                 raise ValueError(f"OpenAI TTS API error - incorrect format. Error: {error_msg}")
             raise ValueError(f"TTS conversion failed: {error_msg}")
+    
+    async def stream_speech(
+        self,
+        text: str,
+        voice: str = "coral",
+        instructions: Optional[str] = None,
+        response_format: str = "mp3",
+        chunk_size: int = TTS_STREAM_CHUNK_BYTES
+    ) -> AsyncIterator[bytes]:
+        """
+        Yield synthesized audio as OpenAI produces it instead of waiting for the
+        whole file. "pcm" and "opus" give the lowest time-to-first-audio.
+        Cached audio is served without calling OpenAI; a completed stream is
+        cached if it fits the cache's per-entry limit.
+        """
+        speech_cache = get_speech_cache()
+        cache_key = self.speech_cache_key(text, voice, instructions, response_format)
+        cached = await speech_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"TTS cache hit: {len(cached)} bytes")
+            yield cached
+            return
+        
+        logger.info(f"Streaming text to speech: {len(text)} characters, voice: {voice}")
+        
+        params = self._speech_params(text, voice, instructions, response_format)
+        total = 0
+        buffer: Optional[bytearray] = bytearray()
+        
+        with get_circuit_breaker("openai_tts", is_openai_failure).guard():
+            async with self.client.audio.speech.with_streaming_response.create(**params) as response:
+                async for chunk in response.iter_bytes(chunk_size):
+                    total += len(chunk)
+                    if buffer is not None:
+                        buffer += chunk
+                        if len(buffer) > speech_cache.max_entry_bytes:
+                            buffer = None
+                    yield chunk
+        
+        logger.info(f"TTS stream completed: {total} bytes")
+        
+        if buffer is not None:
+            await speech_cache.put(cache_key, bytes(buffer))
+    
+    def speech_cache_key(
+        self,
+        text: str,
+        voice: str,
+        instructions: Optional[str],
+        response_format: Optional[str]
+    ) -> str:
+        return speech_cache_key(self.tts_model, voice, instructions, response_format, text)
+    
+    def _speech_params(
+        self,
+        text: str,
+        voice: str,
+        instructions: Optional[str],
+        response_format: Optional[str]
+    ) -> Dict[str, Any]:
+        params = {
+            "model": self.tts_model,
+            "voice": voice,
+            "input": text,
+        }
+        if instructions:
+            params["instructions"] = instructions
+        if response_format:
+            params["response_format"] = response_format
+        return params
+
+
+def is_openai_failure(e: Exception) -> bool:
+    """Only connection errors, timeouts, 429s and 5xxs count against the circuit."""
+    # Transport errors surface raw from httpx once a streamed response is being read
+    return isinstance(
+        e, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError, httpx.TransportError)
+    )
 
 
 _whisper_service: Optional[WhisperService] = None
@@ -164,7 +398,17 @@ _openai_whisper_service: Optional[OpenAIWhisperService] = None
 def get_whisper_service() -> WhisperService:
     global _whisper_service
     if _whisper_service is None:
-        _whisper_service = WhisperService()
+        cpu_threads = max(1, int(os.getenv("STT_CPU_THREADS", "2")))
+        _whisper_service = WhisperService(
+            model_name=os.getenv("STT_LOCAL_MODEL", "base"),
+            compute_type=os.getenv("STT_COMPUTE_TYPE", "int8"),
+            # Workers x threads per worker fills the cores without oversubscribing them
+            workers=int(os.getenv("STT_WORKERS", str(max(1, (os.cpu_count() or 1) // cpu_threads)))),
+            cpu_threads=cpu_threads,
+            queue_size=int(os.getenv("STT_QUEUE_SIZE", "16")),
+            queue_timeout=float(os.getenv("STT_QUEUE_TIMEOUT", "10")),
+            start_timeout=float(os.getenv("STT_START_TIMEOUT", "300"))
+        )
     return _whisper_service
 
 
@@ -173,3 +417,36 @@ def get_openai_whisper_service() -> OpenAIWhisperService:
     if _openai_whisper_service is None:
         _openai_whisper_service = OpenAIWhisperService()
     return _openai_whisper_service
+
+
+def get_stt_service() -> Union[WhisperService, OpenAIWhisperService]:
+    """
+    Speech-to-text service picked by STT_BACKEND: "openai" (default) or
+    "local" for the on-box faster-whisper worker pool.
+    """
+    backend = os.getenv("STT_BACKEND", "openai").lower()
+    if backend == "local":
+        return get_whisper_service()
+    if backend == "openai":
+        return get_openai_whisper_service()
+    raise ValueError(f"Unknown STT_BACKEND: {backend}")
+
+
+async def start_stt_service() -> None:
+    """Preload the local STT workers at startup when they are the selected backend."""
+    stt_service = get_stt_service()
+    if isinstance(stt_service, WhisperService):
+        await stt_service.start()
+
+
+async def close_stt_service() -> None:
+    global _openai_whisper_service
+    if _whisper_service is not None:
+        await _whisper_service.stop()
+    if _openai_whisper_service is not None:
+        service, _openai_whisper_service = _openai_whisper_service, None
+        await service.close()
+
+
+def get_local_stt_stats() -> Optional[Dict[str, Any]]:
+    return _whisper_service.stats() if _whisper_service is not None else None
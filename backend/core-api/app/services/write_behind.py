@@ -0,0 +1,289 @@
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.services.spool import Spool, read_segment
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    Background writer that takes row inserts off the request path.
+
+    Requests enqueue {table: [rows]} items, which are appended to an on-disk
+    spool and fsynced (in groups) before enqueue() returns, so an acknowledged
+    write survives a crash or a database outage. A single replayer task wakes
+    on new items, waits `flush_interval` seconds so rows from concurrent
+    requests can pile up, seals the active spool segment and drains every
+    sealed segment with the async `writer`, `max_batch` items per call. Rows are deduplicated by primary key ("id"
+    unless `primary_keys` names another column for the table) and the
+    writer must ignore conflicts, so replaying a segment twice is harmless.
+    A segment is deleted only after all of its rows are written; on failure it
+    stays on disk and is retried on its own backoff while later segments keep
+    draining. When nothing can be written at all (the database is down), the
+    replayer as a whole backs off instead. After `max_attempts` failed drains
+    of the same segment its items are retried one at a time and the ones that
+    still fail (e.g. rows violating a constraint) are moved to a dead-letter
+    segment.
+
+    The spool is bounded by `max_spool_bytes`: when it is full, enqueue()
+    waits up to `enqueue_timeout` seconds for the replayer to free space,
+    which pushes back on the requests producing rows, and then drops the
+    item (counted in `dropped`) rather than grow the spool without limit.
+    """
+
+    def __init__(
+        self,
+        writer: Callable[[Dict[str, List[Dict[str, Any]]]], Awaitable[None]],
+        spool: Spool,
+        primary_keys: Optional[Dict[str, str]] = None,
+        flush_interval: float = 0.005,
+        max_batch: int = 500,
+        retry_backoff_cap: float = 30.0,
+        max_spool_bytes: int = 64 * 1024 * 1024,
+        enqueue_timeout: float = 5.0,
+        max_attempts: int = 20
+    ):
+        self.writer = writer
+        self.spool = spool
+        self.primary_keys = primary_keys or {}
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.retry_backoff_cap = retry_backoff_cap
+        self.max_spool_bytes = max_spool_bytes
+        self.enqueue_timeout = enqueue_timeout
+        self.max_attempts = max_attempts
+        self._segment_attempts: Dict[str, int] = {}
+        self._segment_retry_at: Dict[str, float] = {}
+        self._wakeup = asyncio.Event()
+        self._space_freed = asyncio.Event()
+        self._stop_requested = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self._consecutive_failures = 0
+        self.enqueued = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._stop_requested.clear()
+            self._task = asyncio.create_task(self._run())
+            # Replay whatever an earlier process left in the spool
+            self._wakeup.set()
+
+    async def stop(self) -> None:
+        """Try one last drain, then stop the replayer. Unwritten rows stay spooled for the next start."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._stop_requested.set()
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        await self.spool.close()
+
+    async def enqueue(self, rows: Dict[str, List[Dict[str, Any]]]) -> None:
+        self.start()
+        if not await self._wait_for_space():
+            row_count = sum(len(table_rows) for table_rows in rows.values())
+            self.dropped += row_count
+            logger.error(f"Write-behind spool full ({self.spool.size_bytes()} bytes), dropping {row_count} rows")
+            return
+        self.spool.append(rows)
+        await self.spool.sync()
+        self.enqueued += 1
+        self._wakeup.set()
+
+    def has_pending(self) -> bool:
+        return bool(self.spool.pending_segments())
+
+    async def flush(self, timeout: float) -> bool:
+        """
+        Wait up to `timeout` seconds until everything spooled before the call
+        is in the database, for reads that must see a just-enqueued row.
+        Returns whether it got there in time.
+        """
+        pending = set(self.spool.pending_segments())
+        deadline = time.monotonic() + timeout
+        self._wakeup.set()
+        while True:
+            self._space_freed.clear()
+            pending.intersection_update(self.spool.pending_segments())
+            if not pending:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._space_freed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+
+    async def _wait_for_space(self) -> bool:
+        deadline = time.monotonic() + self.enqueue_timeout
+        while self.spool.size_bytes() >= self.max_spool_bytes:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._space_freed.clear()
+            try:
+                await asyncio.wait_for(self._space_freed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._stopping:
+                await asyncio.sleep(self.flush_interval)
+
+            retry_at, outage = await self._drain()
+            if self._stopping:
+                if retry_at is not None:
+                    logger.warning("Write-behind stopped with rows still spooled; they will be replayed on next start")
+                return
+            if retry_at is None:
+                self._consecutive_failures = 0
+                continue
+
+            if outage:
+                # Nothing could be written: back off as a whole; new enqueues do not cut the wait short, a stop does
+                self._consecutive_failures += 1
+                delay = min(self.retry_backoff_cap, 0.1 * (2 ** self._consecutive_failures))
+                try:
+                    await asyncio.wait_for(self._stop_requested.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                # Only some segments are failing; new rows are still written as they arrive
+                self._consecutive_failures = 0
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, retry_at - time.monotonic()))
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.set()
+
+    async def _drain(self) -> Tuple[Optional[float], bool]:
+        """
+        Write out all sealed segments that are due, oldest first. A segment
+        that fails waits for its own retry and does not hold back the ones
+        after it, unless the next segment fails too, which points at the
+        database rather than the rows. Returns when the earliest failed
+        segment is due again (None once the spool is drained) and whether
+        every write attempted failed.
+        """
+        retry_at: Optional[float] = None
+        wrote = failed = last_failed = False
+        for path in await self.spool.rotate():
+            due = self._segment_retry_at.get(path, 0.0)
+            if due > time.monotonic():
+                retry_at = due if retry_at is None else min(retry_at, due)
+                continue
+            claim = self.spool.claim(path)
+            if claim is None:
+                # Another process is still appending to or replaying it
+                continue
+            try:
+                written = await self._drain_segment(path)
+            finally:
+                self.spool.release(claim)
+
+            if written:
+                wrote, last_failed = True, False
+                self._segment_attempts.pop(path, None)
+                self._segment_retry_at.pop(path, None)
+                self._space_freed.set()
+                continue
+
+            due = self._segment_retry_at[path]
+            retry_at = due if retry_at is None else min(retry_at, due)
+            failed = True
+            if last_failed:
+                break
+            last_failed = True
+        return retry_at, failed and not wrote
+
+    async def _drain_segment(self, path: str) -> bool:
+        items = list(read_segment(path))
+        for start in range(0, len(items), self.max_batch):
+            if await self._flush(items[start:start + self.max_batch]):
+                continue
+            attempts = self._segment_attempts.get(path, 0) + 1
+            if attempts < self.max_attempts:
+                self._segment_attempts[path] = attempts
+                self._segment_retry_at[path] = time.monotonic() + min(
+                    self.retry_backoff_cap, 0.1 * (2 ** attempts)
+                )
+                return False
+            await self._dead_letter(path, items[start:], attempts)
+            return True
+        self.spool.remove(path)
+        return True
+
+    async def _dead_letter(self, path: str, items: List[Dict[str, List[Dict[str, Any]]]], attempts: int) -> None:
+        """Write what still can be written item by item; set the rest aside for inspection."""
+        failed = []
+        for item in items:
+            if not await self._flush([item]):
+                failed.append(item)
+        if not failed:
+            self.spool.remove(path)
+            return
+        dead_path = self.spool.dead_letter(path, failed)
+        self.dead_lettered += len(failed)
+        logger.error(
+            f"Write-behind segment {path} failed {attempts} times; "
+            f"moved {len(failed)} of {len(items)} remaining items to {dead_path}"
+        )
+
+    async def _flush(self, items: List[Dict[str, List[Dict[str, Any]]]]) -> bool:
+        merged: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for item in items:
+            for table, rows in item.items():
+                by_id = merged.setdefault(table, {})
+                key = self.primary_keys.get(table, "id")
+                for row in rows:
+                    by_id.setdefault(row[key], row)
+        rows_by_table = {table: list(by_id.values()) for table, by_id in merged.items()}
+        row_count = sum(len(rows) for rows in rows_by_table.values())
+
+        started_at = time.monotonic()
+        try:
+            await self.writer(rows_by_table)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Write-behind flush of {row_count} rows failed, keeping them spooled: {str(e)}")
+            return False
+
+        elapsed_ms = (time.monotonic() - started_at) * 1000
+        self.flushes += 1
+        self.rows_written += row_count
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "spool": self.spool.stats(),
+            "spool_capacity_bytes": self.max_spool_bytes,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "dead_lettered": self.dead_lettered,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "failures": self.failures,
+            "consecutive_failures": self._consecutive_failures,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
@@ -1,24 +1,53 @@
 import os
+import re
+import json
+import time
+import asyncio
+import logging
+import contextvars
+import httpx
 import requests
-from typing import Optional, Dict, Any
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Tuple, List, AsyncIterator, Iterator
+
+from app.services.cache import TTLCache
+from app.services.circuit_breaker import CircuitOpenError, get_circuit_breaker
+from app.services.http_client import get_http_client
+from app.services.rate_limit import TokenBucket, backoff_delay, parse_retry_after
+from app.services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
 
 
 class YelpAIService:
     BASE_URL = "https://api.yelp.com/ai/chat/v2"
+    BUSINESS_DETAILS_URL = "https://api.yelp.com/v3/businesses"
     
     def __init__(self):
         self.api_key = os.getenv("YELP_API_KEY")
         if not self.api_key:
             raise ValueError("YELP_API_KEY environment variable is required")
+        self.details_concurrency = int(os.getenv("YELP_DETAILS_CONCURRENCY", "3"))
+        self.details_deadline = float(os.getenv("YELP_DETAILS_DEADLINE", "5"))
+        self.details_volatile_ttl = float(os.getenv("YELP_DETAILS_VOLATILE_TTL", "300"))
+        # Off by default: cached first turns carry no chat_id, so the client's next turn loses the conversation
+        self.chat_cache_enabled = os.getenv("YELP_CHAT_CACHE_ENABLED", "false").lower() == "true"
+        self.chat_cache_geohash_precision = int(os.getenv("YELP_CHAT_CACHE_GEOHASH_PRECISION", "6"))
+        self.request_budget = float(os.getenv("YELP_REQUEST_BUDGET", "30"))
+        self.max_retries = int(os.getenv("YELP_MAX_RETRIES", "3"))
+        self.retry_backoff_base = float(os.getenv("YELP_RETRY_BACKOFF_BASE", "0.5"))
+        self.retry_backoff_cap = float(os.getenv("YELP_RETRY_BACKOFF_CAP", "8"))
+        # Tokens of the rate limit that background work (prefetching) leaves to user requests
+        self.background_reserve = float(os.getenv("YELP_RATE_LIMIT_BACKGROUND_RESERVE", "5"))
 
-    def chat(
-        self, 
-        query: str, 
-        latitude: Optional[float] = None, 
-        longitude: Optional[float] = None,
-        chat_id: Optional[str] = None,
-        locale: str = "en_US"
-    ) -> Dict[str, Any]:
+    def _build_request(
+        self,
+        query: str,
+        latitude: Optional[float],
+        longitude: Optional[float],
+        chat_id: Optional[str],
+        locale: str
+    ) -> Tuple[Dict[str, str], Dict[str, Any]]:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
@@ -41,6 +70,18 @@ class YelpAIService:
         if chat_id:
             payload["chat_id"] = chat_id
         
+        return headers, payload
+
+    def chat(
+        self, 
+        query: str, 
+        latitude: Optional[float] = None, 
+        longitude: Optional[float] = None,
+        chat_id: Optional[str] = None,
+        locale: str = "en_US"
+    ) -> Dict[str, Any]:
+        headers, payload = self._build_request(query, latitude, longitude, chat_id, locale)
+        
         response = requests.post(
             self.BASE_URL,
             headers=headers,
@@ -57,6 +98,244 @@ class YelpAIService:
         response.raise_for_status()
         
         return response.json()
+
+    async def achat(
+        self, 
+        query: str, 
+        latitude: Optional[float] = None, 
+        longitude: Optional[float] = None,
+        chat_id: Optional[str] = None,
+        locale: str = "en_US",
+        use_cache: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Async variant of chat() that goes through the shared connection pool.
+
+        A first turn (no chat_id) always opens its own Yelp AI conversation and
+        returns its chat_id, so the client can continue it. Only when
+        YELP_CHAT_CACHE_ENABLED is set (off by default) are first turns with
+        `use_cache=True` served from the chat response cache or coalesced with
+        an identical in-flight query; those callers get the payload without a
+        chat_id, which suits stateless card rendering only. If Yelp AI is
+        failing or its circuit is open, an expired cached response is served
+        the same way when available.
+        """
+        cache_key = None
+        if use_cache and self.chat_cache_enabled and not chat_id:
+            cache_key = self.chat_cache_key(query, latitude, longitude, locale)
+            cached = get_chat_response_cache().get(cache_key)
+            if cached is not None:
+                return _without_chat_id(cached)
+        
+        headers, payload = self._build_request(query, latitude, longitude, chat_id, locale)
+        
+        token = object()
+        try:
+            if chat_id or cache_key is not None:
+                # Identical concurrent requests share one upstream call; the token tells its caller apart
+                flight_key = cache_key if cache_key is not None else json.dumps(payload, sort_keys=True)
+                result, owner = await _chat_flight.do(
+                    flight_key, lambda: self._post_chat(headers, payload, cache_key, token)
+                )
+            else:
+                # Each uncached first turn needs a conversation of its own
+                result, owner = await self._post_chat(headers, payload, None, token)
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            stale = get_chat_response_cache().get_stale(cache_key) if cache_key is not None else None
+            if stale is None:
+                raise
+            logger.warning(f"Serving stale Yelp AI response after upstream error: {e}")
+            return _without_chat_id(stale)
+        # A follow-up turn (chat_id given) only coalesces with turns of the same conversation
+        return result if owner is token or chat_id else _without_chat_id(result)
+
+    async def _post_chat(
+        self,
+        headers: Dict[str, str],
+        payload: Dict[str, Any],
+        cache_key: Optional[Tuple[str, str, str]],
+        token: object
+    ) -> Tuple[Dict[str, Any], object]:
+        with get_circuit_breaker("yelp_ai_chat", is_upstream_failure).guard():
+            response = await self._send("POST", self.BASE_URL, headers=headers, json=payload)
+            
+            # Handle rate limit errors gracefully
+            if response.status_code == 429:
+                raise httpx.HTTPStatusError(
+                    "429 Client Error: Rate limit exceeded. Please try again in a moment.",
+                    request=response.request,
+                    response=response
+                )
+            
+            response.raise_for_status()
+        
+        result = response.json()
+        if cache_key is not None and result.get("chat_id"):
+            get_chat_response_cache().set(cache_key, result)
+        
+        return result, token
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request through the Yelp rate limiter.
+
+        Retries use jittered exponential backoff, honoring Retry-After, for as
+        long as the request budget allows. Only failures where the request
+        surely had no effect are retried for a POST: 429s and connect errors.
+        A chat POST that hit a 5xx or read timeout may already have appended
+        the turn to the conversation. Idempotent GETs are also retried on
+        5xx and on other transport errors. Once retries or budget run out,
+        the last response is returned or the last error raised.
+
+        Inside background_requests() the request only uses the part of the
+        rate limit above `background_reserve`, so it never starves requests
+        a user is waiting on.
+        """
+        idempotent = method in ("GET", "HEAD")
+        limiter = get_yelp_rate_limiter()
+        reserve = self.background_reserve if _background.get() else 0.0
+        deadline = time.monotonic() + self.request_budget
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                acquired = remaining > 0 and await asyncio.wait_for(limiter.acquire(timeout=remaining, reserve=reserve), remaining)
+            except asyncio.TimeoutError:
+                acquired = False
+            if not acquired:
+                raise httpx.TimeoutException(f"Yelp request budget exhausted waiting for rate limit: {method} {url}")
+            
+            error: Optional[httpx.TransportError] = None
+            try:
+                response = await get_http_client().request(
+                    method, url, timeout=max(0.1, deadline - time.monotonic()), **kwargs
+                )
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # Never reached Yelp, so retrying is safe for any method
+                error = e
+            except httpx.TransportError as e:
+                if not idempotent:
+                    raise
+                error = e
+            else:
+                retryable = response.status_code == 429 or (idempotent and response.status_code >= 500)
+                if not retryable:
+                    return response
+            
+            retry_after = None if error is not None else parse_retry_after(response.headers.get("Retry-After"))
+            delay = backoff_delay(attempt, self.retry_backoff_base, self.retry_backoff_cap, retry_after)
+            if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                if error is not None:
+                    raise error
+                return response
+            
+            reason = type(error).__name__ if error is not None else response.status_code
+            logger.info(f"Yelp returned {reason} for {method} {url}; retrying in {delay:.2f}s")
+            attempt += 1
+            _retry_stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+    def chat_cache_key(
+        self,
+        query: str,
+        latitude: Optional[float],
+        longitude: Optional[float],
+        locale: str
+    ) -> Tuple[str, str, str]:
+        normalized_query = re.sub(r"\s+", " ", query).strip().lower()
+        cell = (
+            _geohash(latitude, longitude, self.chat_cache_geohash_precision)
+            if latitude is not None and longitude is not None else ""
+        )
+        return normalized_query, locale, cell
+
+    async def get_business_details(self, business_id: str) -> Dict[str, Any]:
+        cache = get_business_details_cache()
+        cached = cache.get_with_age(business_id)
+        if cached is not None:
+            details, age = cached
+            # Open/closed status goes stale much faster than the rest of the payload
+            return details if age <= self.details_volatile_ttl else _without_volatile_fields(details)
+        
+        try:
+            return await _details_flight.do(business_id, lambda: self._fetch_business_details(business_id))
+        except (httpx.HTTPError, CircuitOpenError):
+            stale = cache.get_stale(business_id)
+            if stale is None:
+                raise
+            return _without_volatile_fields(stale)
+
+    async def _fetch_business_details(self, business_id: str) -> Dict[str, Any]:
+        with get_circuit_breaker("yelp_business_details", is_upstream_failure).guard():
+            response = await self._send(
+                "GET",
+                f"{self.BUSINESS_DETAILS_URL}/{business_id}",
+                headers={"Authorization": f"Bearer {self.api_key}"}
+            )
+            response.raise_for_status()
+        
+        details = response.json()
+        get_business_details_cache().set(business_id, details)
+        
+        return details
+
+    async def iter_business_details(
+        self,
+        business_ids: List[str],
+        max_concurrency: Optional[int] = None,
+        deadline: Optional[float] = None
+    ) -> AsyncIterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        """
+        Fetch details for several businesses concurrently, yielding
+        (business_id, details) pairs as each lookup finishes.
+
+        At most `max_concurrency` lookups are in flight at once and the whole
+        fan-out is bounded by `deadline` seconds. Lookups that fail or have not
+        finished by the deadline yield None so callers can fall back to the
+        Yelp AI entity data.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or self.details_concurrency)
+        
+        async def fetch(business_id: str) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    return await self.get_business_details(business_id)
+                except (httpx.HTTPError, CircuitOpenError, ValueError) as e:
+                    # ValueError: a 200 whose body is not valid JSON
+                    logger.warning(f"Business details lookup failed for {business_id}: {e}")
+                    return None
+        
+        tasks = {asyncio.create_task(fetch(business_id)): business_id for business_id in dict.fromkeys(business_ids)}
+        pending = set(tasks)
+        ends_at = time.monotonic() + (deadline or self.details_deadline)
+        try:
+            while pending:
+                remaining = ends_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield tasks[task], task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        if pending:
+            logger.info(f"{len(pending)} business details lookups missed the deadline")
+        for task in pending:
+            yield tasks[task], None
+
+    async def get_business_details_many(
+        self,
+        business_ids: List[str],
+        max_concurrency: Optional[int] = None,
+        deadline: Optional[float] = None
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Collect iter_business_details() into a business_id -> details map."""
+        return {
+            business_id: details
+            async for business_id, details in self.iter_business_details(business_ids, max_concurrency, deadline)
+        }
     
     def extract_businesses_from_response(self, yelp_response: Dict[str, Any]) -> list:
         businesses = []
@@ -118,5 +397,119 @@ class YelpAIService:
         return businesses
 
 
+def is_upstream_failure(e: Exception) -> bool:
+    """Only transport errors, timeouts, 429s and 5xxs count against the circuit."""
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, httpx.TransportError)
+
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def _geohash(latitude: float, longitude: float, precision: int) -> str:
+    """Encode a coordinate as a geohash; precision 6 is a ~1.2km x 0.6km cell."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def _without_chat_id(response: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in response.items() if key != "chat_id"}
+
+
+def _without_volatile_fields(details: Dict[str, Any]) -> Dict[str, Any]:
+    hours = details.get("hours")
+    if not hours:
+        return details
+    return {**details, "hours": [{**h, "is_open_now": None} for h in hours]}
+
+
+_yelp_ai_service: Optional[YelpAIService] = None
+_business_details_cache: Optional[TTLCache] = None
+_chat_response_cache: Optional[TTLCache] = None
+_yelp_rate_limiter: Optional[TokenBucket] = None
+_background: contextvars.ContextVar = contextvars.ContextVar("yelp_background_requests", default=False)
+_retry_stats = {"retries": 0}
+_chat_flight = SingleFlight()
+_details_flight = SingleFlight()
+
+
 def get_yelp_ai_service() -> YelpAIService:
-    return YelpAIService()
+    global _yelp_ai_service
+    if _yelp_ai_service is None:
+        _yelp_ai_service = YelpAIService()
+    return _yelp_ai_service
+
+
+
+def get_business_details_cache() -> TTLCache:
+    global _business_details_cache
+    if _business_details_cache is None:
+        _business_details_cache = TTLCache(
+            max_entries=int(os.getenv("YELP_DETAILS_CACHE_SIZE", "2048")),
+            ttl=float(os.getenv("YELP_DETAILS_CACHE_TTL", "3600"))
+        )
+    return _business_details_cache
+
+
+def get_chat_response_cache() -> TTLCache:
+    global _chat_response_cache
+    if _chat_response_cache is None:
+        _chat_response_cache = TTLCache(
+            max_entries=int(os.getenv("YELP_CHAT_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("YELP_CHAT_CACHE_TTL", "300")),
+            max_bytes=int(os.getenv("YELP_CHAT_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+            sizeof=lambda value: len(json.dumps(value))
+        )
+    return _chat_response_cache
+
+
+def get_single_flight_stats() -> Dict[str, Any]:
+    return {
+        "yelp_ai_chat": _chat_flight.stats(),
+        "yelp_business_details": _details_flight.stats(),
+    }
+
+
+@contextmanager
+def background_requests() -> Iterator[None]:
+    """Mark Yelp requests made in this context (and tasks it starts) as low priority."""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+def get_yelp_rate_limiter() -> TokenBucket:
+    global _yelp_rate_limiter
+    if _yelp_rate_limiter is None:
+        _yelp_rate_limiter = TokenBucket(
+            rate=float(os.getenv("YELP_RATE_LIMIT_QPS", "5")),
+            burst=int(os.getenv("YELP_RATE_LIMIT_BURST", "10"))
+        )
+    return _yelp_rate_limiter
+
+
+def get_rate_limit_stats() -> Dict[str, Any]:
+    return {**get_yelp_rate_limiter().stats(), **_retry_stats}
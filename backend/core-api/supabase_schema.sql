@@ -13,6 +13,9 @@ CREATE TABLE conversations (
 
 CREATE INDEX idx_conversations_user_id ON conversations(user_id);
 CREATE INDEX idx_conversations_created_at ON conversations(created_at DESC);
+-- A Yelp AI chat_id is only unique per user: one conversation per (user_id, chat_id)
+CREATE UNIQUE INDEX idx_conversations_user_id_chat_id ON conversations(user_id, chat_id);
+CREATE INDEX idx_conversations_user_id_created_at ON conversations(user_id, created_at DESC, id DESC);
 
 -- Prompts table
 CREATE TABLE prompts (
@@ -24,19 +27,27 @@ CREATE TABLE prompts (
     latitude FLOAT,
     longitude FLOAT,
     yelp_response JSONB,
+    yelp_response_hash TEXT,  -- SHA-256 of yelp_response, the key of its copy in the local response archive
+    response_text TEXT,
+    business_ids JSONB,
     created_at TIMESTAMP DEFAULT NOW()
 );
 
 CREATE INDEX idx_prompts_conversation_id ON prompts(conversation_id);
 CREATE INDEX idx_prompts_user_id ON prompts(user_id);
 CREATE INDEX idx_prompts_created_at ON prompts(created_at DESC);
+CREATE INDEX idx_prompts_conversation_id_created_at ON prompts(conversation_id, created_at DESC);
 
--- Restaurants discovered (individual restaurants from Yelp AI results)
-CREATE TABLE restaurants_discovered (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-    prompt_id UUID REFERENCES prompts(id) ON DELETE CASCADE,
-    user_id TEXT NOT NULL DEFAULT 'user_123',
-    yelp_business_id TEXT NOT NULL,
+-- Migrating an existing database:
+-- ALTER TABLE prompts
+--     ADD COLUMN yelp_response_hash TEXT,
+--     ADD COLUMN response_text TEXT,
+--     ADD COLUMN business_ids JSONB;
+-- UPDATE prompts SET response_text = yelp_response -> 'response' ->> 'text';
+
+-- Business catalog: one row per Yelp business, upserted whenever it is discovered
+CREATE TABLE businesses (
+    yelp_business_id TEXT PRIMARY KEY,
     alias TEXT,
     name TEXT NOT NULL,
     rating FLOAT,
@@ -56,7 +67,6 @@ CREATE TABLE restaurants_discovered (
     country TEXT,
     latitude FLOAT,
     longitude FLOAT,
-    ai_insight TEXT,
     business_url TEXT,
     menu_url TEXT,
     accepts_reservations BOOLEAN,
@@ -73,6 +83,17 @@ CREATE TABLE restaurants_discovered (
     ambience JSONB,
     noise_level TEXT,
     price_range INT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Restaurants discovered (one slim row per result of a prompt; attributes live in businesses)
+CREATE TABLE restaurants_discovered (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    prompt_id UUID REFERENCES prompts(id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL DEFAULT 'user_123',
+    yelp_business_id TEXT NOT NULL REFERENCES businesses(yelp_business_id),
+    ai_insight TEXT,
     created_at TIMESTAMP DEFAULT NOW()
 );
 
@@ -80,6 +101,62 @@ CREATE INDEX idx_restaurants_discovered_prompt_id ON restaurants_discovered(prom
 CREATE INDEX idx_restaurants_discovered_user_id ON restaurants_discovered(user_id);
 CREATE INDEX idx_restaurants_discovered_yelp_business_id ON restaurants_discovered(yelp_business_id);
 CREATE INDEX idx_restaurants_discovered_created_at ON restaurants_discovered(created_at DESC);
+CREATE INDEX idx_restaurants_discovered_user_id_created_at ON restaurants_discovered(user_id, created_at DESC, id DESC);
+CREATE INDEX idx_restaurants_discovered_user_id_yelp_business_id ON restaurants_discovered(user_id, yelp_business_id, created_at DESC);
+
+-- Migrating a database that still has full business copies in restaurants_discovered:
+-- INSERT INTO businesses (
+--     yelp_business_id, alias, name, rating, review_count, price, phone, yelp_url, image_url,
+--     photos, cuisine, categories, address, address1, city, state, zip_code, country, latitude,
+--     longitude, business_url, menu_url, accepts_reservations, delivery_available,
+--     takeout_available, good_for_groups, good_for_kids, wheelchair_accessible, alcohol, wifi,
+--     has_tv, outdoor_seating, parking, ambience, noise_level, price_range, created_at, updated_at
+-- )
+-- SELECT DISTINCT ON (yelp_business_id)
+--     yelp_business_id, alias, name, rating, review_count, price, phone, yelp_url, image_url,
+--     photos, cuisine, categories, address, address1, city, state, zip_code, country, latitude,
+--     longitude, business_url, menu_url, accepts_reservations, delivery_available,
+--     takeout_available, good_for_groups, good_for_kids, wheelchair_accessible, alcohol, wifi,
+--     has_tv, outdoor_seating, parking, ambience, noise_level, price_range, created_at, NOW()
+-- FROM restaurants_discovered
+-- ORDER BY yelp_business_id, created_at DESC;
+-- ALTER TABLE restaurants_discovered
+--     DROP COLUMN alias,
+--     DROP COLUMN name,
+--     DROP COLUMN rating,
+--     DROP COLUMN review_count,
+--     DROP COLUMN price,
+--     DROP COLUMN phone,
+--     DROP COLUMN yelp_url,
+--     DROP COLUMN image_url,
+--     DROP COLUMN photos,
+--     DROP COLUMN cuisine,
+--     DROP COLUMN categories,
+--     DROP COLUMN address,
+--     DROP COLUMN address1,
+--     DROP COLUMN city,
+--     DROP COLUMN state,
+--     DROP COLUMN zip_code,
+--     DROP COLUMN country,
+--     DROP COLUMN latitude,
+--     DROP COLUMN longitude,
+--     DROP COLUMN business_url,
+--     DROP COLUMN menu_url,
+--     DROP COLUMN accepts_reservations,
+--     DROP COLUMN delivery_available,
+--     DROP COLUMN takeout_available,
+--     DROP COLUMN good_for_groups,
+--     DROP COLUMN good_for_kids,
+--     DROP COLUMN wheelchair_accessible,
+--     DROP COLUMN alcohol,
+--     DROP COLUMN wifi,
+--     DROP COLUMN has_tv,
+--     DROP COLUMN outdoor_seating,
+--     DROP COLUMN parking,
+--     DROP COLUMN ambience,
+--     DROP COLUMN noise_level,
+--     DROP COLUMN price_range,
+--     ADD FOREIGN KEY (yelp_business_id) REFERENCES businesses(yelp_business_id);
 
 -- User swipes (tracks swipe actions)
 CREATE TABLE user_swipes (
@@ -95,6 +172,7 @@ CREATE INDEX idx_user_swipes_user_id ON user_swipes(user_id);
 CREATE INDEX idx_user_swipes_restaurant_id ON user_swipes(restaurant_id);
 CREATE INDEX idx_user_swipes_action ON user_swipes(action);
 CREATE INDEX idx_user_swipes_created_at ON user_swipes(created_at DESC);
+CREATE INDEX idx_user_swipes_user_id_yelp_business_id ON user_swipes(user_id, yelp_business_id);
 
 -- User saved restaurants
 CREATE TABLE user_saved_restaurants (
@@ -145,11 +223,264 @@ CREATE TABLE user_preferences (
 
 CREATE INDEX idx_user_preferences_user_id ON user_preferences(user_id);
 
+-- Preference profile derived from swipes, maintained incrementally by a trigger on user_swipes
+CREATE TABLE user_preference_profiles (
+    user_id TEXT PRIMARY KEY,
+    liked_names JSONB NOT NULL DEFAULT '[]'::jsonb,
+    disliked_names JSONB NOT NULL DEFAULT '[]'::jsonb,
+    cuisine_counts JSONB NOT NULL DEFAULT '{}'::jsonb,
+    price_counts JSONB NOT NULL DEFAULT '{}'::jsonb,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Writes a prompt's conversation, prompt, discovered restaurants and their catalog entries in one round trip.
+-- Each argument is a JSON array of rows; rows whose id already exists are skipped.
+CREATE OR REPLACE FUNCTION record_discoveries(
+    p_conversations JSONB DEFAULT '[]'::jsonb,
+    p_prompts JSONB DEFAULT '[]'::jsonb,
+    p_restaurants JSONB DEFAULT '[]'::jsonb,
+    p_businesses JSONB DEFAULT '[]'::jsonb
+) RETURNS VOID AS $$
+BEGIN
+    -- Skips conversations that exist by id or by (user_id, chat_id)
+    INSERT INTO conversations
+    SELECT * FROM jsonb_populate_recordset(NULL::conversations, p_conversations)
+    ON CONFLICT DO NOTHING;
+
+    INSERT INTO prompts
+    SELECT * FROM jsonb_populate_recordset(NULL::prompts, p_prompts)
+    ON CONFLICT (id) DO NOTHING;
+
+    -- Refresh a catalog entry at most once a day so repeat discoveries cost no write
+    INSERT INTO businesses
+    SELECT * FROM jsonb_populate_recordset(NULL::businesses, p_businesses)
+    ON CONFLICT (yelp_business_id) DO UPDATE SET
+        alias = EXCLUDED.alias,
+        name = EXCLUDED.name,
+        rating = EXCLUDED.rating,
+        review_count = EXCLUDED.review_count,
+        price = EXCLUDED.price,
+        phone = EXCLUDED.phone,
+        yelp_url = EXCLUDED.yelp_url,
+        image_url = EXCLUDED.image_url,
+        photos = EXCLUDED.photos,
+        cuisine = EXCLUDED.cuisine,
+        categories = EXCLUDED.categories,
+        address = EXCLUDED.address,
+        address1 = EXCLUDED.address1,
+        city = EXCLUDED.city,
+        state = EXCLUDED.state,
+        zip_code = EXCLUDED.zip_code,
+        country = EXCLUDED.country,
+        latitude = EXCLUDED.latitude,
+        longitude = EXCLUDED.longitude,
+        business_url = EXCLUDED.business_url,
+        menu_url = EXCLUDED.menu_url,
+        accepts_reservations = EXCLUDED.accepts_reservations,
+        delivery_available = EXCLUDED.delivery_available,
+        takeout_available = EXCLUDED.takeout_available,
+        good_for_groups = EXCLUDED.good_for_groups,
+        good_for_kids = EXCLUDED.good_for_kids,
+        wheelchair_accessible = EXCLUDED.wheelchair_accessible,
+        alcohol = EXCLUDED.alcohol,
+        wifi = EXCLUDED.wifi,
+        has_tv = EXCLUDED.has_tv,
+        outdoor_seating = EXCLUDED.outdoor_seating,
+        parking = EXCLUDED.parking,
+        ambience = EXCLUDED.ambience,
+        noise_level = EXCLUDED.noise_level,
+        price_range = EXCLUDED.price_range,
+        updated_at = NOW()
+    WHERE businesses.updated_at < NOW() - INTERVAL '1 day';
+
+    INSERT INTO restaurants_discovered
+    SELECT * FROM jsonb_populate_recordset(NULL::restaurants_discovered, p_restaurants)
+    ON CONFLICT (id) DO NOTHING;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Fold one swipe into the user's preference profile.
+-- Names are most-recent-first and capped (20 liked, 10 disliked); liked cuisines and prices are counted.
+CREATE OR REPLACE FUNCTION apply_swipe_to_profile(
+    p_user_id TEXT,
+    p_restaurant_id UUID,
+    p_action TEXT
+) RETURNS VOID AS $$
+DECLARE
+    r businesses%ROWTYPE;
+BEGIN
+    SELECT b.* INTO r
+    FROM restaurants_discovered d
+    JOIN businesses b ON b.yelp_business_id = d.yelp_business_id
+    WHERE d.id = p_restaurant_id;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO user_preference_profiles (user_id) VALUES (p_user_id)
+    ON CONFLICT (user_id) DO NOTHING;
+
+    IF p_action = 'right' THEN
+        UPDATE user_preference_profiles SET
+            liked_names = jsonb_path_query_array(jsonb_build_array(r.name) || (liked_names - r.name), '$[0 to 19]'),
+            cuisine_counts = CASE WHEN r.cuisine IS NULL THEN cuisine_counts
+                ELSE jsonb_set(cuisine_counts, ARRAY[r.cuisine], to_jsonb(COALESCE((cuisine_counts ->> r.cuisine)::INT, 0) + 1)) END,
+            price_counts = CASE WHEN r.price IS NULL THEN price_counts
+                ELSE jsonb_set(price_counts, ARRAY[r.price], to_jsonb(COALESCE((price_counts ->> r.price)::INT, 0) + 1)) END,
+            updated_at = NOW()
+        WHERE user_id = p_user_id;
+    ELSIF p_action = 'left' THEN
+        UPDATE user_preference_profiles SET
+            disliked_names = jsonb_path_query_array(jsonb_build_array(r.name) || (disliked_names - r.name), '$[0 to 9]'),
+            updated_at = NOW()
+        WHERE user_id = p_user_id;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION user_swipes_update_profile() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM apply_swipe_to_profile(NEW.user_id, NEW.restaurant_id, NEW.action);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Fires only for rows actually inserted, so replayed (conflicting) swipes are not counted twice
+CREATE TRIGGER user_swipes_update_profile
+AFTER INSERT ON user_swipes
+FOR EACH ROW EXECUTE FUNCTION user_swipes_update_profile();
+
+-- One-off backfill for databases that already have swipes:
+-- DO $$
+-- DECLARE s RECORD;
+-- BEGIN
+--     FOR s IN SELECT user_id, restaurant_id, action FROM user_swipes ORDER BY created_at LOOP
+--         PERFORM apply_swipe_to_profile(s.user_id, s.restaurant_id, s.action);
+--     END LOOP;
+-- END $$;
+
+-- Per-user totals for /restaurants/discover, maintained by triggers
+CREATE TABLE user_discovery_counters (
+    user_id TEXT PRIMARY KEY,
+    discovered_count BIGINT NOT NULL DEFAULT 0,
+    swiped_count BIGINT NOT NULL DEFAULT 0  -- distinct businesses swiped
+);
+
+CREATE OR REPLACE FUNCTION restaurants_discovered_count() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO user_discovery_counters (user_id, discovered_count) VALUES (NEW.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET discovered_count = user_discovery_counters.discovered_count + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER restaurants_discovered_count
+AFTER INSERT ON restaurants_discovered
+FOR EACH ROW EXECUTE FUNCTION restaurants_discovered_count();
+
+CREATE OR REPLACE FUNCTION user_swipes_count() RETURNS TRIGGER AS $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM user_swipes
+        WHERE user_id = NEW.user_id AND yelp_business_id = NEW.yelp_business_id
+          -- Only the earliest swipe of a business counts, even within one bulk insert
+          AND (created_at, id) < (NEW.created_at, NEW.id)
+    ) THEN
+        INSERT INTO user_discovery_counters (user_id, swiped_count) VALUES (NEW.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET swiped_count = user_discovery_counters.swiped_count + 1;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER user_swipes_count
+AFTER INSERT ON user_swipes
+FOR EACH ROW EXECUTE FUNCTION user_swipes_count();
+
+-- One-off backfill for databases that already have data:
+-- INSERT INTO user_discovery_counters (user_id, discovered_count, swiped_count)
+-- SELECT u.user_id,
+--        (SELECT COUNT(*) FROM restaurants_discovered d WHERE d.user_id = u.user_id),
+--        (SELECT COUNT(DISTINCT yelp_business_id) FROM user_swipes s WHERE s.user_id = u.user_id)
+-- FROM (SELECT user_id FROM restaurants_discovered UNION SELECT user_id FROM user_swipes) u
+-- ON CONFLICT (user_id) DO UPDATE SET
+--     discovered_count = EXCLUDED.discovered_count,
+--     swiped_count = EXCLUDED.swiped_count;
+
+-- One page of a user's discovered restaurants that they have not swiped, newest first, each
+-- with its full businesses row (the shape /discover always returned), plus the counters.
+-- Keyset pagination on (created_at, id) like chat_history().
+CREATE OR REPLACE FUNCTION discover_unswiped(
+    p_user_id TEXT,
+    p_limit INT DEFAULT 20,
+    p_before_created_at TIMESTAMP DEFAULT NULL,
+    p_before_id UUID DEFAULT NULL
+) RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'restaurants', COALESCE((
+            SELECT jsonb_agg(to_jsonb(page) ORDER BY page.created_at DESC, page.id DESC)
+            FROM (
+                SELECT d.*, b.alias, b.name, b.rating, b.review_count, b.price, b.phone,
+                       b.yelp_url, b.image_url, b.photos, b.cuisine, b.categories, b.address,
+                       b.address1, b.city, b.state, b.zip_code, b.country, b.latitude,
+                       b.longitude, b.business_url, b.menu_url, b.accepts_reservations,
+                       b.delivery_available, b.takeout_available, b.good_for_groups,
+                       b.good_for_kids, b.wheelchair_accessible, b.alcohol, b.wifi, b.has_tv,
+                       b.outdoor_seating, b.parking, b.ambience, b.noise_level, b.price_range
+                FROM restaurants_discovered d
+                JOIN businesses b ON b.yelp_business_id = d.yelp_business_id
+                WHERE d.user_id = p_user_id
+                  AND (p_before_created_at IS NULL OR (d.created_at, d.id) < (p_before_created_at, p_before_id))
+                  AND NOT EXISTS (
+                      SELECT 1 FROM user_swipes s
+                      WHERE s.user_id = p_user_id AND s.yelp_business_id = d.yelp_business_id
+                  )
+                ORDER BY d.created_at DESC, d.id DESC
+                LIMIT p_limit
+            ) page
+        ), '[]'::jsonb),
+        'total_discovered', COALESCE(c.discovered_count, 0),
+        'total_swiped', COALESCE(c.swiped_count, 0)
+    )
+    FROM (SELECT 1) one
+    LEFT JOIN user_discovery_counters c ON c.user_id = p_user_id;
+$$ LANGUAGE sql STABLE;
+
+-- One page of a user's conversations, newest first, each with its latest prompt.
+-- Keyset pagination: pass the created_at and id of the last row of the previous page.
+CREATE OR REPLACE FUNCTION chat_history(
+    p_user_id TEXT,
+    p_limit INT DEFAULT 20,
+    p_before_created_at TIMESTAMP DEFAULT NULL,
+    p_before_id UUID DEFAULT NULL
+) RETURNS TABLE (
+    id UUID,
+    chat_id TEXT,
+    created_at TIMESTAMP,
+    last_message TEXT
+) AS $$
+    SELECT c.id, c.chat_id, c.created_at, p.prompt_text
+    FROM conversations c
+    LEFT JOIN LATERAL (
+        SELECT prompt_text
+        FROM prompts
+        WHERE prompts.conversation_id = c.id
+        ORDER BY prompts.created_at DESC
+        LIMIT 1
+    ) p ON TRUE
+    WHERE c.user_id = p_user_id
+      AND (p_before_created_at IS NULL OR (c.created_at, c.id) < (p_before_created_at, p_before_id))
+    ORDER BY c.created_at DESC, c.id DESC
+    LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
+
 -- Comments
 COMMENT ON TABLE conversations IS 'Tracks chat sessions with Yelp AI API';
 COMMENT ON TABLE prompts IS 'Stores user text/voice queries and full Yelp AI responses';
+COMMENT ON TABLE businesses IS 'Deduplicated catalog of Yelp businesses, keyed by yelp_business_id';
 COMMENT ON TABLE restaurants_discovered IS 'Individual restaurants from Yelp AI search results';
 COMMENT ON TABLE user_swipes IS 'Tracks all swipe actions (right/left/up/down)';
 COMMENT ON TABLE user_saved_restaurants IS 'User''s saved restaurants (right/up swipes only)';
 COMMENT ON TABLE reservations IS 'Restaurant reservations made by users';
 COMMENT ON TABLE user_preferences IS 'User preferences for AI personalization';
+COMMENT ON TABLE user_preference_profiles IS 'Swipe-derived preference profile, maintained by trigger';